@@ -0,0 +1,215 @@
+#include <Python.h>
+
+#include <fcntl.h>
+#include <errno.h>
+#include <limits.h>
+#include <unistd.h>
+#include <sys/syscall.h>
+
+#ifndef KEYCTL_WATCH_KEY
+#define KEYCTL_WATCH_KEY 32
+#endif
+
+/* Bindings for Linux system calls that are not provided by the
+ * Python standard library. Calls are made with the GIL released,
+ * and are restarted if interrupted by a signal that does not
+ * raise an exception. If the signal handler raises an exception,
+ * the exception is propagated in place of the interrupted call. */
+
+static int
+convertOffset_(PyObject *aObject, loff_t *aOffset, loff_t **aOffsetp)
+{
+    int rc = -1;
+
+    if ( ! aObject || Py_None == aObject)
+        *aOffsetp = 0;
+    else
+    {
+        long long offset = PyLong_AsLongLong(aObject);
+        if (-1 == offset && PyErr_Occurred())
+            goto out;
+
+        *aOffset  = offset;
+        *aOffsetp = aOffset;
+    }
+
+    rc = 0;
+
+  out:
+
+    return rc;
+}
+
+static PyObject *
+splice_(PyObject *aSelf, PyObject *aArgs, PyObject *aKwds)
+{
+    static char *kwlist[] = {
+        "src", "dst", "count", "offset_src", "offset_dst", "flags", 0 };
+
+    int          src;
+    int          dst;
+    Py_ssize_t   count;
+    unsigned int flags = 0;
+
+    PyObject *srcoffsetobj = 0;
+    PyObject *dstoffsetobj = 0;
+
+    if ( ! PyArg_ParseTupleAndKeywords(
+             aArgs, aKwds, "iin|OOI:splice", kwlist,
+             &src, &dst, &count, &srcoffsetobj, &dstoffsetobj, &flags))
+        return 0;
+
+    loff_t  srcoffset;
+    loff_t  dstoffset;
+    loff_t *srcoffsetp;
+    loff_t *dstoffsetp;
+
+    if (convertOffset_(srcoffsetobj, &srcoffset, &srcoffsetp)
+        || convertOffset_(dstoffsetobj, &dstoffset, &dstoffsetp))
+        return 0;
+
+    if (0 > count)
+    {
+        PyErr_SetString(PyExc_ValueError, "negative count");
+        return 0;
+    }
+
+    ssize_t rc;
+
+    while (1)
+    {
+        Py_BEGIN_ALLOW_THREADS
+        rc = splice(src, srcoffsetp, dst, dstoffsetp, count, flags);
+        Py_END_ALLOW_THREADS
+
+        if (-1 != rc)
+            break;
+
+        if (EINTR != errno)
+            return PyErr_SetFromErrno(PyExc_OSError);
+
+        if (PyErr_CheckSignals())
+            return 0;
+    }
+
+    return PyLong_FromSsize_t(rc);
+}
+
+static PyObject *
+tee_(PyObject *aSelf, PyObject *aArgs, PyObject *aKwds)
+{
+    static char *kwlist[] = { "src", "dst", "count", "flags", 0 };
+
+    int          src;
+    int          dst;
+    Py_ssize_t   count;
+    unsigned int flags = 0;
+
+    if ( ! PyArg_ParseTupleAndKeywords(
+             aArgs, aKwds, "iin|I:tee", kwlist,
+             &src, &dst, &count, &flags))
+        return 0;
+
+    if (0 > count)
+    {
+        PyErr_SetString(PyExc_ValueError, "negative count");
+        return 0;
+    }
+
+    ssize_t rc;
+
+    while (1)
+    {
+        Py_BEGIN_ALLOW_THREADS
+        rc = tee(src, dst, count, flags);
+        Py_END_ALLOW_THREADS
+
+        if (-1 != rc)
+            break;
+
+        if (EINTR != errno)
+            return PyErr_SetFromErrno(PyExc_OSError);
+
+        if (PyErr_CheckSignals())
+            return 0;
+    }
+
+    return PyLong_FromSsize_t(rc);
+}
+
+static PyObject *
+keyctlWatchKey_(PyObject *aSelf, PyObject *aArgs)
+{
+    int key;
+    int fd;
+    int watchId;
+
+    if ( ! PyArg_ParseTuple(
+             aArgs, "iii:keyctl_watch_key", &key, &fd, &watchId))
+        return 0;
+
+    long rc;
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = syscall(SYS_keyctl, KEYCTL_WATCH_KEY, key, fd, watchId);
+    Py_END_ALLOW_THREADS
+
+    if (-1 == rc)
+        return PyErr_SetFromErrno(PyExc_OSError);
+
+    Py_RETURN_NONE;
+}
+
+static PyMethodDef methods_[] =
+{
+    { "splice", (PyCFunction)(void (*)(void)) splice_,
+      METH_VARARGS | METH_KEYWORDS,
+      "splice(src, dst, count, offset_src=None, offset_dst=None, flags=0)\n"
+      "\n"
+      "Transfer count bytes from src to dst using splice(2)." },
+
+    { "tee", (PyCFunction)(void (*)(void)) tee_,
+      METH_VARARGS | METH_KEYWORDS,
+      "tee(src, dst, count, flags=0)\n"
+      "\n"
+      "Duplicate count bytes from pipe src to pipe dst using tee(2)." },
+
+    { "keyctl_watch_key", keyctlWatchKey_,
+      METH_VARARGS,
+      "keyctl_watch_key(key, fd, watch_id)\n"
+      "\n"
+      "Watch for changes to key and post notifications to the\n"
+      "notification pipe fd, or remove the watch if watch_id is -1." },
+
+    { 0 }
+};
+
+static struct PyModuleDef module_ =
+{
+    PyModuleDef_HEAD_INIT,
+    "_linux",
+    "Linux system calls not provided by the standard library.",
+    -1,
+    methods_,
+};
+
+PyMODINIT_FUNC
+PyInit__linux(void)
+{
+    PyObject *module = PyModule_Create(&module_);
+    if ( ! module)
+        goto out;
+
+    if (PyModule_AddIntConstant(module, "SPLICE_F_MOVE", SPLICE_F_MOVE)
+        || PyModule_AddIntConstant(
+            module, "SPLICE_F_NONBLOCK", SPLICE_F_NONBLOCK)
+        || PyModule_AddIntConstant(module, "SPLICE_F_MORE", SPLICE_F_MORE))
+    {
+        Py_DECREF(module);
+        module = 0;
+    }
+
+  out:
+
+    return module;
+}
@@ -17,23 +17,30 @@ set -ex
 cd "${0%/*}"
 
 [ $# -eq 0 ] || {
-    exec pip install -r requirements.txt "$@"
+    exec python3 -m pip install -r requirements.txt "$@"
     exit 1
 }
 
-# Place a symlink in the source directory that points to the built
-# shared library. This will allow the package to be run in-situ.
+# Place symlinks in the source directory that point to the built
+# shared libraries. This will allow the package to be run in-situ.
 
-python setup.py build_ext
+python3 setup.py build_ext
 (
+    set --
     for lib in build/lib.*/"${PWD##*/}"/*.so ; do
+        [ -r "$lib" ] || continue
         [ -r lib/"${PWD##*/}/${lib##*/}" ] ||
             ln -sf ../../"$lib" lib/"${PWD##*/}"/
-        exit 0
+        set -- "$@" "$lib"
     done
-    exit 1
+    [ $# -ne 0 ]
 )
 
+# Precompile the package so that the command does not compile it when
+# first run, or on every run when the source directory is not writable.
+
+python3 -m compileall -q lib
+
 # Obtain the current commit of the install script, and check if it was the one
 # used to perform the last install, if any.
 
@@ -50,7 +57,7 @@ VERSION="$(readlink "${0%/*}/pkg/VERSION")" || VERSION=
 
 rm -rf pkg
 
-pip install --target pkg -r requirements.txt
+python3 -m pip install --target pkg -r requirements.txt
 
 # Once the installation completes, stamp the directory atomically so that the
 # next run can determine that the installer completed successfully.
@@ -0,0 +1,39 @@
+# Shell integration for bash(1) and zsh(1).
+#
+# Source this file from an interactive shell to define a keysafe
+# function that wraps the keysafe command. On first use, the command
+# provides the salt and the revised command line directly to the
+# function on descriptor 3, rather than typing a script fragment
+# at the terminal. The salt is kept in an unexported shell variable,
+# and the revised command line is placed in the line editor for
+# review. No helper process is left waiting for the shell.
+
+keysafe()
+{
+    typeset _KEYSAFE_SCRIPT
+
+    # Capture descriptor 3 while leaving stdout connected to the
+    # terminal so that the command can run normally when the salt
+    # is already known.
+
+    {
+        _KEYSAFE_SCRIPT=$(
+            command keysafe --shell "$$" "$@" 3>&1 1>&4 4>&-)
+    } 4>&1 || return
+
+    [ -n "$_KEYSAFE_SCRIPT" ] || return 0
+
+    typeset _KEYSAFE_COMMAND
+    eval "$_KEYSAFE_SCRIPT" || return
+
+    if [ -n "${ZSH_VERSION-}" ] ; then
+        print -z -- "$_KEYSAFE_COMMAND"
+    elif [ -n "${BASH_VERSION-}" ] ; then
+        typeset _KEYSAFE_LINE
+        read -e -r -p '> ' -i "$_KEYSAFE_COMMAND" _KEYSAFE_LINE || return
+        history -s -- "$_KEYSAFE_LINE"
+        eval "$_KEYSAFE_LINE"
+    else
+        printf '%s\n' "$_KEYSAFE_COMMAND"
+    fi
+}
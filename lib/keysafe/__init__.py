@@ -0,0 +1,2 @@
+from .api import (
+    recall, memorise, forget, clearCache, Secret, UndecipherableKeyError)
@@ -1,5 +1,3 @@
-from __future__ import absolute_import
-
 import os
 import os.path
 import stat
@@ -11,13 +9,16 @@ import argparse
 import resource
 import errno
 import time
-import pipes
+import shlex
 import fcntl
 import struct
 import select
 import contextlib
+import importlib.machinery
 
 from . import store as _store
+from . import backend as _backend
+from . import stats as _stats
 from . import pipeline as _pipeline
 
 _NAME    = os.path.basename(os.path.dirname(__file__)).upper()
@@ -26,9 +27,13 @@ _KEYSALT = '.'
 _KEYPFX  = '_{}_'.format(_NAME)
 
 _FILE    = '@@'
+_SHELLFD = 3
 _TIMEOUT = 60
 _ARG0    = os.path.basename(os.path.dirname(sys.argv[0]))
 
+_F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+_F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
+
 
 def die(msg):
     sys.stderr.write('{}: {}\n'.format(_ARG0, msg))
@@ -67,7 +72,7 @@ def createKeySuffix():
     suffix = []
     while True:
         suffix.insert(0, suffixes[duration % len(suffixes)])
-        duration /= len(suffixes)
+        duration //= len(suffixes)
         if not duration:
             break
 
@@ -82,30 +87,64 @@ def fdclose(fd):
 
 def writeMemento(outfile, memento):
     try:
-        outfile.write(memento + '\n')
+        outfile.write(memento + b'\n')
         outfile.flush()
-    except IOError as exc:
+    except OSError as exc:
         if exc.errno != errno.EPIPE:
             die('Unable to write memento - {}'.format(exc))
         raise
 
 
-def pipeMemento(inpfile, outfile, memento):
-    pipeline = _pipeline.Pipeline(inpfile, outfile)
+def mementoFd(memento):
+
+    # Return a descriptor from which the memento can be read in full
+    # once this process has written it, without requiring a fob process
+    # to stay behind to write it. Prefer an anonymous memory file, but
+    # fall back to a pipe, enlarging it where necessary so that writing
+    # the memento cannot block before there is a reader.
+
+    try:
+        rdfd = os.memfd_create(_NAME.lower())
+        wrfd = os.dup(rdfd)
+    except (AttributeError, OSError):
+        rdfd, wrfd = os.pipe()
+        try:
+            size = len(memento) + 1
+            if fcntl.fcntl(wrfd, _F_GETPIPE_SZ) < size:
+                fcntl.fcntl(wrfd, _F_SETPIPE_SZ, size)
+        except BaseException:
+            os.close(rdfd)
+            os.close(wrfd)
+            raise
+
+    try:
+        with os.fdopen(wrfd, 'wb') as wrfile:
+            wrfd = None
+            writeMemento(wrfile, memento)
+    except BaseException:
+        fdclose(wrfd)
+        os.close(rdfd)
+        raise
+
+    return rdfd
+
+
+def pipeMemento(inpfile, outfile, memento, teefiles=()):
+    pipeline = _pipeline.Pipeline(inpfile, outfile, teefiles)
     try:
         with contextlib.closing(pipeline):
             writeMemento(pipeline, memento)
             runPipeline(pipeline)
-    except IOError as exc:
+    except OSError as exc:
         if exc.errno != errno.EPIPE:
-            raise IOError(errno.EPIPE, os.strerror(errno))
+            raise OSError(errno.EPIPE, os.strerror(errno.EPIPE))
 
 
 def runPipeline(pipeline):
     try:
         while pipeline.splice(8192) != 0:
             pass
-    except IOError as exc:
+    except OSError as exc:
         if exc.errno != errno.EPIPE:
             die('Unable to transfer data - {}'.format(exc))
         raise
@@ -146,10 +185,10 @@ def ttyEchoEnabled(ttyfile):
 
 
 def typeMemento(inpfile, memento):
-    for ch in memento + '\n':
+    for ch in memento + b'\n':
         for _ in backoff(2):
             if not ttyEchoEnabled(inpfile):
-                fcntl.ioctl(inpfile.fileno(), termios.TIOCSTI, ch)
+                fcntl.ioctl(inpfile.fileno(), termios.TIOCSTI, bytes((ch,)))
                 break
 
 
@@ -159,9 +198,14 @@ def readMemento():
     else:
         dupfd = os.open('/dev/tty', os.O_RDWR)
     try:
-        with os.fdopen(dupfd, 'r+') as dupfile:
+        # The stream is only used to write the prompt, and is opened
+        # write-only because text streams opened for update must be
+        # seekable.
+
+        with os.fdopen(dupfd, 'w') as dupfile:
             dupfd = None
-            return getpass.getpass('Memento: ', dupfile)
+            return getpass.getpass('Memento: ', dupfile).encode(
+                dupfile.encoding)
     finally:
         dupfd = fdclose(dupfd)
 
@@ -178,6 +222,77 @@ def waitProcess(pid):
     return exitcode
 
 
+def findLibrary():
+
+    # The shared library is built as an extension module, so its
+    # name carries the suffix of the interpreter that built it.
+
+    libdir  = os.path.dirname(os.path.abspath(__file__))
+    libname = 'lib{}'.format(os.path.basename(libdir))
+
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        libpath = os.path.join(libdir, libname + suffix)
+        if os.path.exists(libpath):
+            break
+    else:
+        die('Unable to find shared library - {}'.format(libname))
+
+    return libpath
+
+
+def commandLine(args, rdfd):
+
+    # Construct the command line and environment that will deliver the
+    # memento read from the descriptor to the command.
+
+    env = dict(os.environ)
+
+    devrdfd = '/dev/fd/{}'.format(rdfd)
+    if not args.arg and args.env is None:
+        cmd = [
+            devrdfd if word is None else word
+            for word in args.command
+        ]
+    else:
+        libpath = findLibrary()
+
+        if ':' in libpath or ' ' in libpath:
+            raise RuntimeError(libpath)
+
+        env['_{}_PRELOAD'.format(_NAME)]  = libpath
+        env['_{}_ARGFILE'.format(_NAME)]  = devrdfd
+
+        ldpreload = 'LD_PRELOAD'
+        env[ldpreload] = (
+            '{}:{}'.format(libpath, env[ldpreload])
+            if ldpreload in env else
+            libpath)
+
+        if args.env is not None:
+
+            # Only the name of the variable is passed through the
+            # environment. The library sets the variable inside the
+            # command, so the memento does not appear in the initial
+            # environment visible in /proc/pid/environ.
+
+            env.pop(args.env, None)
+            env['_{}_ARGENV'.format(_NAME)] = args.env
+
+            cmd = list(args.command)
+        else:
+            env['_{}_ARGINDEX'.format(_NAME)] = (
+                    str(args.command.index(None)))
+
+            argword = _FILE if args.file is None else args.file
+
+            cmd = [
+                argword if word is None else word
+                for word in args.command
+            ]
+
+    return cmd, env
+
+
 def spawnFob(rdfile, wrfile, args):
 
     # The fob process is an orphaned grandchild of the main application
@@ -189,44 +304,20 @@ def spawnFob(rdfile, wrfile, args):
     if childpid:
         exitcode = waitProcess(childpid)
         if not exitcode:
-            devrdfd = '/dev/fd/{}'.format(rdfile.fileno())
-            if not args.arg:
-                cmd = [
-                    devrdfd if word is None else word
-                    for word in args.command
-                ]
-            else:
-                libdir  = os.path.join(os.path.dirname(__file__))
-                libname = 'lib{}.so'.format(os.path.basename(libdir))
-                libpath = os.path.join(libdir, libname)
-
-                if ':' in libpath or ' ' in libpath:
-                    raise RuntimeError(libpath)
-
-                os.environ['_{}_PRELOAD'.format(_NAME)]  = libpath
-                os.environ['_{}_ARGFILE'.format(_NAME)]  = devrdfd
-                os.environ['_{}_ARGINDEX'.format(_NAME)] = (
-                        str(args.command.index(None)))
 
-                ldpreload = 'LD_PRELOAD'
-                os.environ[ldpreload] = (
-                    '{}:{}'.format(libpath, os.environ[ldpreload])
-                    if ldpreload in os.environ else
-                    libpath)
+            # Descriptors are created non-inheritable, so explicitly
+            # allow the command to inherit the read side of the pipe.
 
-                argword = _FILE if args.file is None else args.file
+            os.set_inheritable(rdfile.fileno(), True)
 
-                cmd = [
-                    argword if word is None else word
-                    for word in args.command
-                ]
+            cmd, env = commandLine(args, rdfile.fileno())
 
             if args.pipe:
                 os.dup2(rdfile.fileno(), sys.stdin.fileno())
                 rdfile.close()
             wrfile.close()
 
-            os.execvp(args.command[0], cmd)
+            os.execvpe(args.command[0], cmd, env)
             exitcode = 1
 
         os._exit(exitcode)
@@ -236,15 +327,94 @@ def spawnFob(rdfile, wrfile, args):
         os._exit(0)
 
 
+def spawnJob(args, memento, item):
+
+    # Write the memento in full before starting the command. This
+    # process holds the decrypted memento, and serves as the fob
+    # for every command.
+
+    rdfd = mementoFd(memento)
+    try:
+        os.set_inheritable(rdfd, True)
+
+        cmd, env = commandLine(args, rdfd)
+        cmd.append(item)
+
+        if hasattr(os, 'posix_spawnp'):
+            pid = os.posix_spawnp(
+                cmd[0], cmd, env,
+                file_actions=[
+                    (os.POSIX_SPAWN_OPEN,
+                     sys.stdin.fileno(), os.devnull, os.O_RDONLY, 0)])
+        else:
+            pid = os.fork()
+            if not pid:
+                try:
+                    with open(os.devnull, 'rb') as nullfile:
+                        os.dup2(nullfile.fileno(), sys.stdin.fileno())
+                    os.execvpe(cmd[0], cmd, env)
+                finally:
+                    os._exit(127)
+    finally:
+        rdfd = fdclose(rdfd)
+
+    return pid
+
+
+def runJobs(memento, args):
+
+    # Read the items from stdin, one per line, and run the command
+    # once for each item, appending the item to the command line as
+    # xargs(1) does. Keep up to the requested number of commands
+    # running concurrently. As with xargs(1), the exit code is 123
+    # if any command fails.
+
+    exitcode = 0
+    running  = set()
+
+    def _reap():
+        pid, status = os.wait()
+        running.discard(pid)
+        return os.WIFSIGNALED(status) or os.WEXITSTATUS(status)
+
+    try:
+        for line in sys.stdin:
+            item = line.rstrip('\n')
+            if not item:
+                continue
+
+            while len(running) >= args.jobs:
+                if _reap():
+                    exitcode = 123
+
+            try:
+                running.add(spawnJob(args, memento, item))
+            except OSError as exc:
+                sys.stderr.write('{}: Unable to run command - {}\n'.format(
+                    _ARG0, exc))
+                exitcode = 127
+                break
+    finally:
+        while running:
+            if _reap() and not exitcode:
+                exitcode = 123
+
+    return exitcode
+
+
 def closeFds(keepfds):
+
+    # Close the gaps between the descriptors to keep. Where available,
+    # os.closerange() uses close_range(2) to close each gap with
+    # a single system call.
+
     numfds, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
-    for fd in xrange(0, numfds):
-        try:
-            if fd not in keepfds:
-                fdclose(fd)
-        except OSError as exc:
-            if exc.errno != errno.EBADF:
-                raise
+
+    lowfd = 0
+    for fd in sorted(keepfds) + [numfds]:
+        if lowfd < fd:
+            os.closerange(lowfd, fd)
+        lowfd = fd + 1
 
 
 def readKey(filename):
@@ -260,7 +430,7 @@ def readKey(filename):
         keystat  = (filestat.st_dev, filestat.st_ino)
 
         numfds, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
-        for fd in xrange(0, numfds):
+        for fd in range(0, numfds):
             if fd != keyfile.fileno():
                 try:
                     filestat = os.fstat(fd)
@@ -282,7 +452,7 @@ class HelpFormatter(argparse.HelpFormatter):
         elif action.nargs == argparse.ONE_OR_MORE:
             result = '{} ...'.format(metavar)
         else:
-            result = super(HelpFormatter, self)._format_args(
+            result = super()._format_args(
                 action, default_metavar)
         return result
 
@@ -295,7 +465,7 @@ class HelpFormatter(argparse.HelpFormatter):
                     [str(choice) for choice in action.choices][0],
                 ) * tuple_size
         else:
-            formatter = super(HelpFormatter, self)._metavar_formatter(
+            formatter = super()._metavar_formatter(
                 action, default_metavar)
         return formatter
 
@@ -315,9 +485,25 @@ def createParser():
     modeGroup = argparser.add_mutually_exclusive_group()
     modeGroup.add_argument(
         '-R', '--revoke', action = 'store_true',
-        help = 'Revoke the stored memento.')
+        help = 'Revoke the stored memento, or with --namespace and no'
+        ' key, all the mementos of the namespace.')
 
-    ioGroup = modeGroup.add_mutually_exclusive_group()
+    modeGroup.add_argument(
+        '--stats', action = 'store_true',
+        help = 'Report how often mementos were recalled, missing, expired'
+        ' or undecipherable, and how often mementos were memorised.')
+
+    modeGroup.add_argument(
+        '--rotate', action = 'store', metavar = 'FILE',
+        help = 'Treat the key as a pattern, and re-encrypt the memento'
+        ' of each matching key using the new salt in the file. The'
+        ' current salt is provided using --salt or --unsalted, and'
+        ' --jobs limits the number of keys re-encrypted at a time.')
+
+    # Nesting mutually exclusive groups is deprecated, so share the
+    # mode group directly rather than nesting a group for the i/o options.
+
+    ioGroup = modeGroup
     ioGroup.add_argument(
         '-f', '--file', action = 'store',
         help = 'Use a file. Unless --arg is used, the name of the file'
@@ -334,11 +520,31 @@ def createParser():
         '-p', '--pipe', action = 'store_true',
         help = 'Use a pipe. The command will read the memento from stdin.')
 
+    ioGroup.add_argument(
+        '-e', '--env', action = 'store', metavar = 'NAME',
+        help = 'Use an environment variable. The command will find the'
+        ' memento in the named environment variable, which is only set'
+        ' once the command has started.')
+
+    argparser.add_argument(
+        '--tee', action = 'append', metavar = 'FILE',
+        help = 'When using --pipe, also send the memento and the'
+        ' data from stdin to this file. The file receives the memento'
+        ' in the clear. The option can be repeated to send to several'
+        ' files.')
+
     argparser.add_argument(
         '-1', '--oneline', action='store_true',
         help = 'When using --pipe, close stdin after sending the memento'
         ' rather than allowing the command to read more data.')
 
+    argparser.add_argument(
+        '-j', '--jobs', type = int, action = 'store', metavar = 'N',
+        help = 'Read items from stdin, one per line, and run the command'
+        ' once for each item with the item appended, running up to N'
+        ' commands at a time. The memento is recalled once, and'
+        ' delivered to each command through its own file.')
+
     argparser.add_argument(
         '-a', '--arg', action = 'store_true',
         help = 'When using --file, the memento will be inserted'
@@ -358,12 +564,43 @@ def createParser():
         help = 'Timeout in minutes to retain memento'
         ' value after last use. Use zero or less to retain indefinitely.')
 
+    argparser.add_argument(
+        '--iterations', type = int, action = 'store', metavar = 'N',
+        help = 'Number of PBKDF2 iterations used to derive the key.')
+
+    argparser.add_argument(
+        '--new-iterations', type = int, action = 'store', metavar = 'N',
+        help = 'When using --rotate, the number of PBKDF2 iterations'
+        ' used to derive the new key.')
+
+    argparser.add_argument(
+        '--backend', action = 'store',
+        choices = (_backend.KeyRingBackend.NAME, _backend.ShmBackend.NAME),
+        help = 'Store the memento in the kernel session keyring, or in'
+        ' a private tmpfs directory. By default, the keyring is used'
+        ' unless keyctl(2) is not available.')
+
+    argparser.add_argument(
+        '--user', action = 'store_true',
+        help = 'Share the memento with every session of the user, using'
+        ' a salt kept in the user keyring rather than one held by the'
+        ' shell.')
+
+    argparser.add_argument(
+        '--namespace', action = 'store', metavar = 'NAME',
+        help = 'Keep the memento in a keyring of its own, separate from'
+        ' other keys in the session, for example one for each project.')
+
     argparser.add_argument(
         '--program',
         help=argparse.SUPPRESS)
 
     argparser.add_argument(
-        'key', action = 'store',
+        '--shell', type = int, metavar = 'PID',
+        help=argparse.SUPPRESS)
+
+    argparser.add_argument(
+        'key', action = 'store', nargs = '?',
         help = 'Key naming the memento')
 
     argparser.add_argument(
@@ -373,34 +610,48 @@ def createParser():
     return argparser
 
 
-def buildCommand(args, saltvar):
+def buildCommand(args, saltfile):
 
     assert not args.unsalted, args
     assert not args.salt, args
     assert not args.revoke, args
+    assert not args.rotate, args
+    assert not args.user, args
 
     argv = [_ARG0 if args.program is None else args.program]
     if args.file is not None:
-        argv.extend(['-f', pipes.quote(args.file)])
+        argv.extend(['-f', shlex.quote(args.file)])
     if args.tty:
         argv.append('-t')
     if args.pipe:
         argv.append('-p1' if args.oneline else '-p')
+    if args.env is not None:
+        argv.extend(['-e', shlex.quote(args.env)])
+    for teename in args.tee or ():
+        argv.extend(['--tee', shlex.quote(teename)])
     if args.arg:
         argv.append('-a')
+    if args.jobs is not None:
+        argv.extend(['-j', str(args.jobs)])
     if args.timeout is not None:
-        argv.extend(['-T', args.timeout])
-    argv.extend(['-s', '<(${})'.format(saltvar)])
-    argv.append(pipes.quote(args.key))
+        argv.extend(['-T', str(args.timeout)])
+    if args.iterations is not None:
+        argv.extend(['--iterations', str(args.iterations)])
+    if args.backend is not None:
+        argv.extend(['--backend', args.backend])
+    if args.namespace is not None:
+        argv.extend(['--namespace', shlex.quote(args.namespace)])
+    argv.extend(['-s', saltfile])
+    argv.append(shlex.quote(args.key))
     argv.append('--')
 
     for cmd in args.command:
         if cmd is not None:
-            argv.append(pipes.quote(cmd))
+            argv.append(shlex.quote(cmd))
         elif args.file is None:
             argv.append(_FILE)
         else:
-            argv.append(pipes.quote(args.file))
+            argv.append(shlex.quote(args.file))
 
     def _redirect(direction, fd):
         redirect = []
@@ -410,7 +661,7 @@ def buildCommand(args, saltvar):
                 and not stat.S_ISSOCK(fdstat.st_mode)):
             redirect.append(
                 direction
-                + pipes.quote(os.readlink('/proc/self/fd/{}'.format(fd))))
+                + shlex.quote(os.readlink('/proc/self/fd/{}'.format(fd))))
 
         return redirect
 
@@ -439,12 +690,46 @@ def buildCommand(args, saltvar):
     return argv
 
 
+def saltScript(saltvar, salt):
+    return (
+        'unset {saltvar}\n'
+        '{saltvar}="echo \'{salt}\'"\n'.format(
+            saltvar=saltvar,
+            salt=salt))
+
+
+def sendCommand(shellfile, args, salt):
+
+    # Rather than typing the command at the terminal, provide the
+    # shell function with a script fragment that it can evaluate
+    # directly. The fragment sets the salt variable, and leaves the
+    # revised command in another variable for the user to review.
+    #
+    # Unlike bash, zsh does not split unquoted expansions into words,
+    # so the variable cannot hold a command that echoes the salt. Hold
+    # only the salt, and have printf(1) provide it to the command.
+
+    saltvar = _KEYPFX + createKeySuffix()
+    argv    = buildCommand(
+        args, '<(printf \'%s\\n\' "${}")'.format(saltvar))
+
+    shellfile.write(
+        'unset {saltvar}\n'
+        '{saltvar}={salt}\n'.format(
+            saltvar=saltvar,
+            salt=shlex.quote(salt))
+        + '{cmdvar}={cmd}\n'.format(
+            cmdvar=_KEYPFX + 'COMMAND',
+            cmd=shlex.quote(' '.join(argv))))
+    shellfile.flush()
+
+
 def typeCommand(ttyfile, args, salt):
 
     assert os.isatty(ttyfile.fileno())
 
     saltvar = _KEYPFX + createKeySuffix()
-    argv    = buildCommand(args, saltvar)
+    argv    = buildCommand(args, '<(${})'.format(saltvar))
 
     # Flush and insert the required command into the input buffer
     # ready for use.
@@ -458,11 +743,8 @@ def typeCommand(ttyfile, args, salt):
             with os.fdopen(wrfd, 'w') as wrfile:
                 wrfd = None
                 wrfile.write(
-                    'unset {saltvar}\n'
-                    '{saltvar}="echo \'{salt}\'"\n'
-                    'echo -n . > /proc/{pid}/fd/{fd}\n'.format(
-                        saltvar=saltvar,
-                        salt=salt,
+                    saltScript(saltvar, salt)
+                    + 'echo -n . > /proc/{pid}/fd/{fd}\n'.format(
                         pid=os.getpid(),
                         fd=wrfdstop))
 
@@ -487,19 +769,35 @@ def typeCommand(ttyfile, args, salt):
         cmd = (
             ' . /proc/{pid}/fd/{fd}\n'.format(
                 pid=childpid, fd=rdfd)
-            + ' '.join((str(arg) for arg in argv)))
+            + ' '.join(argv))
 
         with ttyEcho(ttyfile, False), ttySuspendInput(ttyfile):
             termios.tcflush(ttyfile.fileno(), termios.TCIFLUSH)
-            for ch in cmd:
-                fcntl.ioctl(ttyfile.fileno(), termios.TIOCSTI, ch)
+            for ch in os.fsencode(cmd):
+                fcntl.ioctl(
+                    ttyfile.fileno(), termios.TIOCSTI, bytes((ch,)))
 
     finally:
         rdfd = fdclose(rdfd)
         wrfd = fdclose(wrfd)
 
 
-def sendMemento(rdfile, wrfile, args, memento):
+def openTees(args):
+
+    # Open the tee files before the command is started so that the
+    # command is not run if any of the files cannot be opened.
+
+    teefiles = []
+    for teename in args.tee or ():
+        try:
+            teefiles.append(open(teename, 'wb'))
+        except OSError as exc:
+            die('Unable to open tee file - {}'.format(exc))
+
+    return teefiles
+
+
+def sendMemento(rdfile, wrfile, args, memento, teefiles):
 
     with open('/dev/null', 'r+') as nullfile:
 
@@ -519,17 +817,19 @@ def sendMemento(rdfile, wrfile, args, memento):
             sys.stdin.fileno(),
             sys.stdout.fileno(),
             sys.stderr.fileno(),
-            nullfile.fileno()))
+            nullfile.fileno()) + tuple(
+                teefile.fileno() for teefile in teefiles))
 
         closeFds(keepfds)
 
         if args.pipe and not args.oneline:
-            pipeMemento(sys.stdin, sys.stdout, memento)
+            pipeMemento(
+                sys.stdin.buffer, sys.stdout.buffer, memento, teefiles)
         else:
             if args.tty:
                 typeMemento(sys.stdin, memento)
             else:
-                writeMemento(sys.stdout, memento)
+                writeMemento(sys.stdout.buffer, memento)
 
             # Release stdin and stdout to avoid holding
             # any files in common, leaving only stderr
@@ -539,19 +839,94 @@ def sendMemento(rdfile, wrfile, args, memento):
             os.dup2(nullfile.fileno(), sys.stdin.fileno())
 
 
-def run(memento, args):
+def readSalt(filename):
+
+    with open(filename, 'rb') as saltfile:
+        salt = saltfile.readline().rstrip()
+
+    if not salt:
+        die('Key provided with empty salt')
+
+    return salt
+
+
+def rotate(owner, args, salt, timeout, backend):
+
+    newSalt = readSalt(args.rotate)
+
+    rc = 0
+    for name, rotated in _store.rotate(
+            owner, args.key, salt, newSalt,
+            keepalive = None if args.timeout is None else timeout,
+            backend = backend,
+            iterations = args.iterations,
+            newIterations = (
+                args.iterations
+                if args.new_iterations is None else
+                args.new_iterations),
+            jobs = args.jobs):
+        if rotated is False:
+            sys.stderr.write(
+                '{}: Undecipherable key - {}\n'.format(_ARG0, name))
+            rc = 1
+
+    return rc
+
+
+def execEnv(memento, args):
+
+    # The memento is written in full before the command is started, so
+    # no fob process is required.
+
+    try:
+        rdfd = mementoFd(memento)
+    except OSError as exc:
+        die('Unable to hold memento - {}'.format(exc))
+
+    os.set_inheritable(rdfd, True)
+
+    cmd, env = commandLine(args, rdfd)
+
+    os.execvpe(cmd[0], cmd, env)
+
+
+def reportStats(owner):
+
+    counts = _stats.Stats(owner).read()
+
+    for event in _stats.EVENTS:
+        print('{:<16}{:>10}'.format(event, counts[event]))
+
+    recalls = sum(
+        counts[event]
+        for event in ('hit', 'miss', 'expired', 'undecipherable'))
+    if recalls:
+        print('{:<16}{:>9.1f}%'.format(
+            'hit ratio', 100.0 * counts['hit'] / recalls))
+
+    return 0
+
+
+def run(memento, args, teefiles, stats):
+
+    # There is no fob process when using the environment, so update
+    # the counters before running the command.
+
+    if args.env is not None:
+        stats.flush()
+        execEnv(memento, args)
 
     exitcode = None
 
     rdfd, wrfd = os.pipe()
     try:
-        with os.fdopen(wrfd, 'w') as wrfile:
+        with os.fdopen(wrfd, 'wb') as wrfile:
             wrfd = None
-            with os.fdopen(rdfd, 'r') as rdfile:
+            with os.fdopen(rdfd, 'rb') as rdfile:
                 rdfd = None
 
                 spawnFob(rdfile, wrfile, args)
-                sendMemento(rdfile, wrfile, args, memento)
+                sendMemento(rdfile, wrfile, args, memento, teefiles)
     finally:
         rdfd = fdclose(rdfd)
         wrfd = fdclose(wrfd)
@@ -572,19 +947,57 @@ def main(argv=None):
 
 def _main(argv):
 
-    args = createParser().parse_args(argv[1:])
+    argparser = createParser()
+    args = argparser.parse_args(argv[1:])
+
+    if args.stats:
+        if args.key is not None or args.command:
+            die('Statistics conflict with other options')
+        return reportStats(os.path.basename(os.path.dirname(__file__)))
+    elif args.key is None and not (args.revoke and args.namespace):
+        argparser.error('the following arguments are required: key')
+
+    if args.namespace is not None and not args.namespace:
+        die('Namespace must not be empty')
+
+    if args.user and (args.salt is not None or args.unsalted):
+        die('User scope conflicts with salt')
+
+    if args.key is not None and args.key.startswith(_store.RESERVED):
+        die('Reserved key - {}'.format(args.key))
 
     if args.revoke:
-        if any((args.command, args.tty, args.pipe, args.oneline)):
+        if any((args.command, args.tty, args.pipe, args.oneline, args.tee,
+                args.jobs is not None, args.env is not None)):
             die('Revocation conflicts with other options')
+    elif args.rotate:
+        if any((args.command, args.tty, args.pipe, args.oneline, args.tee,
+                args.env is not None, args.user)):
+            die('Rotation conflicts with other options')
+        elif args.salt is None and not args.unsalted:
+            die('Rotation requires the current salt')
+        elif args.jobs is not None and args.jobs < 1:
+            die('At least one job is required')
     else:
+        if args.new_iterations is not None:
+            die('Irrelevant iterations when not rotating')
         if args.oneline and not args.pipe:
             die('Irrelevant argument when pipe not in use')
-        elif args.arg and (args.tty or args.pipe):
+        elif args.tee and (not args.pipe or args.oneline):
+            die('Irrelevant tee when pipe not in use')
+        elif args.jobs is not None and (args.tty or args.pipe):
+            die('Parallel jobs require file delivery')
+        elif args.jobs is not None and args.jobs < 1:
+            die('At least one job is required')
+        elif args.arg and (args.tty or args.pipe or args.env is not None):
             die('Irrelvant argument when file not in use')
         elif args.tty:
             if not os.isatty(sys.stdin.fileno()):
                 die('Typed input requires stdin to be a tty')
+        elif args.env is not None:
+            if not args.env or '=' in args.env:
+                die('Invalid environment variable name - {}'.format(
+                    args.env))
         elif not args.pipe:
             fileword = _FILE if args.file is None else args.file
             if not fileword:
@@ -603,33 +1016,60 @@ def _main(argv):
                 for word in args.command
             ]
 
+    # When invoked from the shell function, the script fragment for
+    # the shell is written to descriptor 3. Move it aside so that it
+    # is not inherited by the command.
+
+    shellfile = None
+    if args.shell is not None:
+        try:
+            shellfile = os.fdopen(os.dup(_SHELLFD), 'w')
+        except OSError as exc:
+            die('Unable to find shell descriptor - {}'.format(exc))
+        os.close(_SHELLFD)
+
     rc = None
 
+    for iterations in (args.iterations, args.new_iterations):
+        if iterations is not None and iterations < 1:
+            die('At least one iteration is required')
+
     if args.salt is not None:
         if args.unsalted:
             die('Salt provided for unsalted key')
 
-        with open(args.salt, 'r') as saltfile:
-            salt = saltfile.readline().rstrip()
+        salt = readSalt(args.salt)
+
+    elif args.user:
+
+        # The salt shared by the sessions of the user is found once
+        # the backend is available, and the key is used as is rather
+        # than being qualified by the shell.
 
-        if not salt:
-            die('Key provided with empty salt')
+        salt = None
 
     elif not args.unsalted and not args.revoke:
         if not args.command:
             die('No command provided')
 
+        salt = ('{:02x}'*3).format(
+            *struct.unpack('!' + 'B'*3, os.urandom(3)))
+
+        if shellfile is not None:
+            args.key += _KEYSEP + str(args.shell)
+
+            with shellfile:
+                sendCommand(shellfile, args, salt)
+
+            return 0
+
         with open('/dev/tty', 'w') as ttyfile:
             if not os.isatty(ttyfile.fileno()):
                 die('Unable to find salt in key - {}'.format(args.key))
 
             args.key += _KEYSEP + str(os.getppid())
 
-            typeCommand(
-                ttyfile,
-                args,
-                ('{:02x}'*3).format(
-                    *struct.unpack('!' + 'B'*3, os.urandom(3))))
+            typeCommand(ttyfile, args, salt)
 
             rc = 127
     else:
@@ -643,17 +1083,44 @@ def _main(argv):
             if args.timeout is None else
             max(0, args.timeout))
 
+        owner = os.path.basename(os.path.dirname(__file__))
+
+        backend = _backend.createBackend(
+            owner, args.backend, args.namespace, args.user)
+
+        if args.rotate:
+            return rotate(owner, args, salt, timeout, backend)
+
+        if args.key is None:
+            backend.clear()
+            return 0
+
+        if args.user and not args.revoke:
+            salt = _store.userSalt(owner, backend)
+
+        stats = _stats.Stats(owner)
+
         store = _store.Store(
-            os.path.basename(os.path.dirname(__file__)),
+            owner,
             args.key,
             salt,
-            keepalive = timeout)
+            keepalive = timeout,
+            backend = backend,
+            iterations = args.iterations,
+            stats = stats)
 
         if args.revoke:
             store.forget()
             rc = 0
         else:
 
+            # The key is derived in the background while the keyring is
+            # searched, so take the opportunity to open the tee files,
+            # which might block waiting for readers, before the memento
+            # is needed.
+
+            teefiles = openTees(args)
+
             # If an update is forced, or the memento is not available from
             # the keyring, obtain the memento from the user.
 
@@ -661,13 +1128,23 @@ def _main(argv):
             if args.command:
                 memento = store.recall()
             if memento is False:
+                stats.flush()
                 die('Undecipherable key - {}'.format(args.key))
             elif memento is None:
                 args.update = True
                 memento = readMemento()
                 store.memorise(memento)
 
-            rc = run(memento, args) if args.command else 0
+            rc = (
+                0 if not args.command else
+                runJobs(memento, args) if args.jobs is not None else
+                run(memento, args, teefiles, stats))
+
+            # Only the fob returns from run(), so the counters are
+            # updated after the memento has been delivered, or once
+            # all the jobs have completed.
+
+            stats.flush()
 
     return rc
 
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import threading
+
+from . import backend as _backend
+from . import store as _store
+
+# In-process interface
+#
+# Recall, memorise and forget mementos without running the command
+# line application. Mementos are stored under the same names as those
+# used by the command line application, so a memento memorised by one
+# can be recalled by the other given the same key and salt.
+#
+# The Store for each key is cached, together with its derived key, so
+# that only the first use of a key pays for the key derivation. Cached
+# Stores watch for changes made by other processes, so that a memento
+# replaced, revoked or forgotten elsewhere is not served from the cache.
+
+_OWNER   = os.path.basename(os.path.dirname(__file__))
+_TIMEOUT = 60
+
+
+class UndecipherableKeyError(ValueError):
+    pass
+
+
+class Secret:
+
+    # Hold a recalled memento in a mutable buffer that is zeroed when
+    # the secret is cleared, or when the context is exited:
+    #
+    #   with keysafe.recall('EXAMPLE', salt) as secret:
+    #       connect(password=secret.decode())
+    #
+    # The buffer is a copy of the decrypted memento, and copies made
+    # by the caller, such as the result of decode(), are not zeroed.
+
+    def __init__(self, value):
+        self.__valid  = False
+        self.__buffer = bytearray(value)
+        self.__valid  = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, excTraceback):
+        self.clear()
+
+    def __del__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.__check())
+
+    def __bytes__(self):
+        return bytes(self.__check())
+
+    def __repr__(self):
+        return '<{} {}>'.format(
+            type(self).__name__, 'valid' if self.__valid else 'cleared')
+
+    def __check(self):
+        if not self.__valid:
+            raise ValueError('Secret has been cleared')
+        return self.__buffer
+
+    @property
+    def value(self):
+        view = memoryview(self.__check())
+        return view.toreadonly() if hasattr(view, 'toreadonly') else view
+
+    def decode(self, encoding='utf-8', errors='strict'):
+        return self.__check().decode(encoding, errors)
+
+    def clear(self):
+        if self.__valid:
+            self.__valid = False
+            for ix in range(len(self.__buffer)):
+                self.__buffer[ix] = 0
+
+
+class _Cache:
+
+    # Map the parameters of each key to a Store, and a lock serialising
+    # its use. The cache is indexed by a digest of the salt rather than
+    # the salt itself.
+
+    def __init__(self):
+        self.__lock     = threading.Lock()
+        self.__stores   = {}
+        self.__backends = {}
+
+    def backend(self, kind, namespace):
+
+        # Unlike the command line application, do not install a session
+        # keyring in the parent process, which might be a service manager
+        # rather than a shell, and do not fall back to another backend
+        # if the keyring is not available, since mementos memorised at
+        # the command line would then silently not be found.
+
+        with self.__lock:
+            backend = self.__backends.get((kind, namespace))
+            if backend is None:
+                backend = (
+                    _backend.KeyRingBackend(_OWNER, namespace, parent=False)
+                    if kind in (None, _backend.KeyRingBackend.NAME) else
+                    _backend.createBackend(_OWNER, kind, namespace))
+                self.__backends[(kind, namespace)] = backend
+        return backend
+
+    def store(self, key, salt, keepalive, backend, iterations, namespace):
+        if isinstance(salt, str):
+            salt = salt.encode()
+
+        index = (
+            key,
+            None if salt is None else hashlib.sha256(salt).digest(),
+            keepalive,
+            backend,
+            iterations,
+            namespace)
+
+        with self.__lock:
+            entry = self.__stores.get(index)
+        if entry is not None:
+            return entry
+
+        if backend is None or isinstance(backend, str):
+            backend = self.backend(backend, namespace)
+
+        store = _store.Store(
+            _OWNER, key, salt,
+            keepalive=keepalive,
+            backend=backend,
+            iterations=iterations,
+            watch=True)
+
+        with self.__lock:
+            entry = self.__stores.setdefault(index, (store, threading.Lock()))
+
+        return entry
+
+    def clear(self):
+        with self.__lock:
+            self.__stores.clear()
+
+
+_CACHE = _Cache()
+
+
+def recall(key, salt=None,
+           keepalive=_TIMEOUT, backend=None, iterations=None,
+           namespace=None):
+
+    # Return the memento as a Secret, or None if no memento is stored
+    # under the key. Raise UndecipherableKeyError if the memento cannot
+    # be decrypted using the salt. Using the memento extends its
+    # lifetime by keepalive minutes, as with the --timeout option. The
+    # memento is kept in the given namespace, as with --namespace.
+
+    store, lock = _CACHE.store(
+        key, salt, keepalive, backend, iterations, namespace)
+    with lock:
+        value = store.recall()
+
+    if value is False:
+        raise UndecipherableKeyError('Undecipherable key - {}'.format(key))
+
+    return None if value is None else Secret(value)
+
+
+def memorise(key, value, salt=None,
+             keepalive=_TIMEOUT, backend=None, iterations=None,
+             namespace=None):
+
+    # Store the memento, which can be bytes, a str, or a Secret,
+    # replacing any memento already stored under the key.
+
+    if isinstance(value, str):
+        value = value.encode()
+
+    store, lock = _CACHE.store(
+        key, salt, keepalive, backend, iterations, namespace)
+    with lock:
+        store.memorise(bytes(value))
+
+
+def forget(key, salt=None,
+           keepalive=_TIMEOUT, backend=None, iterations=None,
+           namespace=None):
+
+    # Revoke the memento stored under the key, if any.
+
+    store, lock = _CACHE.store(
+        key, salt, keepalive, backend, iterations, namespace)
+    with lock:
+        store.forget()
+
+
+def clearCache():
+
+    # Discard the cached Stores and their derived keys.
+
+    _CACHE.clear()
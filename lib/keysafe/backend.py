@@ -0,0 +1,832 @@
+import keyutils
+import base64
+import contextlib
+import errno
+import fcntl
+import math
+import os
+import stat
+import struct
+import sys
+import threading
+import time
+
+from . import watch as _watch
+
+# A backend holds the encrypted mementos on behalf of a Store. Each
+# backend provides the same small set of operations on opaque handles:
+#
+#   names()                    Return the names of the entries
+#   find(name)                 Return the handle of the live entry,
+#                              EXPIRED, or None
+#   read(handle)               Return the content of the entry, or None
+#   lifetime(handle)           Return the remaining lifetime, or None
+#   quantise(secs)             Return the shortest lifetime reported as
+#                              at least secs
+#   setTimeout(handle, secs)   Set the remaining lifetime, or None to retain
+#   add(name, value, secs)     Install a new entry, returning its handle
+#   unlink(handle)             Remove the entry from view
+#   revoke(handle)             Destroy the entry
+#   watch(handle, callback)    Notify callback(handle, event) of changes
+#   clear()                    Remove every entry in the namespace
+#
+# Installing an entry replaces any previous entry of the same name,
+# but the previous entry remains valid until revoked so that concurrent
+# readers never see a partially constructed entry.
+#
+# A backend created with a namespace keeps its entries apart from those
+# of other namespaces, so that entries can be found without searching
+# unrelated entries, and all the entries of a namespace can be removed
+# at once. A backend created for the user shares its entries with every
+# session of the user, rather than only the current session.
+
+# Returned by find() in place of a handle when the entry has expired.
+
+EXPIRED = object()
+
+
+def privateDirectory(owner):
+
+    # Find a directory on tmpfs that is private to the user, preferring
+    # the runtime directory of the login session.
+
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    directory = (
+        os.path.join(runtime, owner) if runtime else
+        '/dev/shm/{}-{}'.format(owner, os.getuid()))
+
+    try:
+        os.mkdir(directory, 0o700)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+    # Refuse to use a directory that might have been planted, or
+    # that could be read by others.
+
+    dirstat = os.lstat(directory)
+    if (not stat.S_ISDIR(dirstat.st_mode)
+            or dirstat.st_uid != os.getuid()
+            or stat.S_IMODE(dirstat.st_mode) & 0o077):
+        raise OSError(
+            errno.EPERM,
+            'Insecure private directory - {}'.format(directory))
+
+    return directory
+
+
+@contextlib.contextmanager
+def privateLock(owner):
+
+    # Serialise changes shared by the processes of the user by locking
+    # a file in the private directory. The directory itself is locked
+    # by the tmpfs backend for each change to its entries, so a lock on
+    # the directory would deadlock changes made while holding it.
+    # Without a private directory, proceed without the lock rather than
+    # failing.
+
+    try:
+        fd = os.open(
+            os.path.join(privateDirectory(owner), '.lock'),
+            os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError:
+        fd = None
+
+    try:
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if fd is not None:
+            os.close(fd)
+
+
+class KeyRingBackend:
+
+    #pylint: disable=no-member
+
+    NAME = 'keyring'
+
+    class _KeyRing: #pylint: disable=no-init
+        SESSION = keyutils.KEY_SPEC_SESSION_KEYRING
+        PROCESS = keyutils.KEY_SPEC_PROCESS_KEYRING
+        USER    = keyutils.KEY_SPEC_USER_KEYRING
+
+    # Permissions granted to the group, and to others, by a key.
+
+    _PERM_OTHERS = keyutils.KEY_GRP_ALL | keyutils.KEY_OTH_ALL
+
+    # Units used by /proc/keys to show the remaining lifetime of a key.
+
+    _LIFETIME = {
+        's' : 1,
+        'm' : 60,
+        'h' : 60 * 60,
+        'd' : 24 * 60 * 60,
+        'w' : 7 * 24 * 60 * 60,
+    }
+
+    def __init__(self, owner, namespace=None, user=False, parent=True):
+
+        # Keys shared by all sessions of the user are held in the user
+        # keyring, which the kernel creates on demand.
+
+        self.__scope = self._KeyRing.USER if user else self._KeyRing.SESSION
+
+        # If the session keyring does not already exist, join a session
+        # keyring named after the login session, and unless prevented,
+        # install it in the parent. Joining is serialised by locking the
+        # private directory of the user, so that concurrent processes
+        # converge on the same keyring rather than each creating a
+        # keyring of its own.
+        #
+        # A process without a session keyring sees the user session
+        # keyring in its place, but linking a key into the session
+        # keyring would then create an anonymous session keyring
+        # private to the process.
+
+        if not user:
+            try:
+                description = keyutils.describe_key(self._KeyRing.SESSION)
+            except keyutils.Error:
+                description = None
+
+            if (description is None or
+                    description.split(b';', 4)[-1].startswith(b'_uid_ses.')):
+                with privateLock(owner):
+                    self._joinSession(self._sessionName(owner))
+                if parent:
+                    keyutils.session_to_parent()
+
+        keyutils.describe_key(self.__scope)
+
+        # Searches of the session keyring descend into the keyrings of
+        # namespaces, so qualify the names of keys in a namespace to
+        # avoid them being found in place of keys outside it.
+
+        self.__owner     = owner
+        self.__namespace = namespace
+        self.__prefix    = (
+            b'' if namespace is None else namespace.encode() + b'/')
+        self.__keyRing   = (
+            self.__scope if namespace is None else
+            self._namespaceKeyRing(owner, namespace, self.__scope))
+
+    def __resolve(self, create=False):
+
+        # The keyring of a namespace is unlinked when the namespace is
+        # cleared, possibly by another process, and might then be
+        # created again, so a long lived backend cannot rely on the
+        # keyring it found when it was created. Search for the keyring
+        # again, creating it if required, and return True if a
+        # different keyring was found.
+
+        if self.__namespace is None:
+            return False
+
+        if create:
+            keyRing = self._namespaceKeyRing(
+                self.__owner, self.__namespace, self.__scope)
+        else:
+            try:
+                keyRing = keyutils.search(
+                    self.__scope,
+                    self._namespaceName(self.__owner, self.__namespace),
+                    keyType=b'keyring')
+            except keyutils.Error as exc:
+                self._expired(exc, keyutils.EKEYREVOKED)
+                keyRing = None
+
+        if keyRing is None or keyRing == self.__keyRing:
+            return False
+
+        self.__keyRing = keyRing
+        return True
+
+    @staticmethod
+    def _namespaceName(owner, namespace):
+        return '{}:_ns:{}'.format(owner, namespace).encode()
+
+    @classmethod
+    def _namespaceKeyRing(cls, owner, namespace, scope):
+
+        # Keep the keys of a namespace in a keyring of their own linked
+        # into the session, or user, keyring. Adding a keyring replaces
+        # any keyring of the same name, so processes that concurrently
+        # create the keyring could be left holding keyrings that are no
+        # longer linked. Serialise creation by locking the private
+        # directory of the user, so that only the first process creates
+        # the keyring and the others find it. Without the lock, search
+        # again after creating the keyring to adopt whichever remains
+        # linked.
+
+        name = cls._namespaceName(owner, namespace)
+
+        with privateLock(owner):
+            keyRing = keyutils.search(scope, name, keyType=b'keyring')
+            if keyRing is None:
+                keyRing = keyutils.add_key(
+                    name, None, scope, keyType=b'keyring')
+                keyRing = keyutils.search(
+                    scope, name, keyType=b'keyring') or keyRing
+
+        return keyRing
+
+    @staticmethod
+    def _sessionName(owner):
+
+        # Qualify the session id with the start time of the session
+        # leader to avoid joining a stale keyring created in an earlier
+        # session that happened to use the same session id. If the
+        # session leader cannot be found, fall back to an anonymous
+        # session keyring.
+
+        sid = os.getsid(0)
+        try:
+            with open('/proc/{}/stat'.format(sid), 'r') as statfile:
+                stat_ = statfile.readline()
+        except OSError:
+            return None
+
+        starttime = stat_.rsplit(')', 1)[-1].split()[19]
+
+        return '{}:_ses:{}.{}'.format(owner, sid, starttime)
+
+    @classmethod
+    def _joinSession(cls, keyRingName):
+
+        # Verify that the joined keyring carries the expected name. If it
+        # does not, another process might have raced to revoke the
+        # keyring after it was found, so retry the join.
+        #
+        # The name of the keyring can be predicted by other users, and
+        # the kernel will join a keyring owned by another user if it
+        # grants permission to search it. Possessing such a keyring
+        # would give its owner access to the keys linked into it, so
+        # only use a keyring owned by the user that grants nothing to
+        # others, and otherwise join an anonymous keyring.
+        #
+        # The kernel only finds a keyring by name if the user is allowed
+        # to search it, but does not grant that permission to keyrings it
+        # creates, so grant it here for other processes to join.
+
+        for _ in range(3):
+            keyutils.join_session_keyring(
+                None if keyRingName is None else keyRingName.encode())
+            if keyRingName is None:
+                break
+
+            description = keyutils.describe_key(cls._KeyRing.SESSION)
+            _, uid, _, perm, name = description.split(b';', 4)
+            if name.decode() == keyRingName:
+                perm = int(perm, 16)
+                if int(uid) != os.getuid() or perm & cls._PERM_OTHERS:
+                    keyRingName = None
+                    keyutils.join_session_keyring(None)
+                elif not perm & keyutils.KEY_USR_SEARCH:
+                    keyutils.set_perm(
+                        cls._KeyRing.SESSION, perm | keyutils.KEY_USR_SEARCH)
+                break
+        else:
+            raise RuntimeError(
+                'Unable to join session keyring - {}'.format(keyRingName))
+
+    @staticmethod
+    def _expired(exc, *errnos):
+        if exc.args[0] not in (keyutils.EKEYEXPIRED,) + errnos:
+            raise exc
+
+    def names(self):
+
+        # Reading a keyring yields the serial numbers of the keys it
+        # holds as an array of native integers. Keys that expire, or are
+        # revoked, while the keyring is examined are skipped.
+
+        self.__resolve()
+
+        try:
+            keyring = keyutils.read_key(self.__keyRing)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED, errno.ENOKEY)
+            return []
+        keyIds  = struct.unpack('={}i'.format(len(keyring) // 4), keyring)
+
+        names = []
+        for keyId in keyIds:
+            try:
+                description = keyutils.describe_key(keyId)
+            except keyutils.Error as exc:
+                self._expired(exc, keyutils.EKEYREVOKED)
+                continue
+            keyType, _, _, _, name = description.split(b';', 4)
+            if keyType == b'user' and name.startswith(self.__prefix):
+                names.append(name[len(self.__prefix):])
+
+        return names
+
+    def find(self, name):
+
+        # If the key is not found in the keyring of a namespace, the
+        # keyring might have been replaced, so search the keyring of
+        # the namespace once more.
+
+        handle = self.__find(name)
+        if handle is None and self.__resolve():
+            handle = self.__find(name)
+        return handle
+
+    def __find(self, name):
+
+        # Searching the keyring of a namespace only examines the keys
+        # of the namespace, whereas request_key(2) searches every
+        # keyring of the process. The user keyring is not a keyring of
+        # the process, so it must also be searched explicitly.
+
+        try:
+            if self.__keyRing != self._KeyRing.SESSION:
+                return keyutils.search(self.__keyRing, self.__prefix + name)
+            return keyutils.request_key(name, self._KeyRing.SESSION)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED)
+            if exc.args[0] == keyutils.EKEYEXPIRED:
+                return EXPIRED
+        return None
+
+    def read(self, handle):
+
+        # A key that is no longer linked anywhere is destroyed, and its
+        # serial number ceases to exist.
+
+        try:
+            return keyutils.read_key(handle)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED, errno.ENOKEY)
+        return None
+
+    def lifetime(self, handle):
+
+        # Each line of /proc/keys starts with the serial number of the
+        # key in hex, and the fourth field shows the remaining lifetime
+        # as perm, expd, or a count rounded down to the nearest unit.
+
+        serial = '{:08x}'.format(handle)
+
+        # If the lifetime cannot be determined, report the key as having
+        # expired so that the caller refreshes it.
+
+        try:
+            with open('/proc/keys', 'r') as keysfile:
+                for line in keysfile:
+                    if line.startswith(serial):
+                        fields = line.split(None, 4)
+                        if fields[0] == serial:
+                            break
+                else:
+                    return 0
+        except OSError:
+            return 0
+
+        lifetime = fields[3]
+        if lifetime == 'perm':
+            return None
+        elif lifetime == 'expd':
+            return 0
+
+        return int(lifetime[:-1]) * self._LIFETIME[lifetime[-1]]
+
+    @classmethod
+    def quantise(cls, secs):
+
+        # The lifetime is shown rounded down to the largest unit that
+        # does not exceed it, so round up to a whole number of that unit.
+        # Each unit is a multiple of the smaller units, so the result is
+        # shown exactly.
+
+        unit = max(
+            [unit for unit in cls._LIFETIME.values() if unit <= secs] or [1])
+
+        return -(-secs // unit) * unit
+
+    def setTimeout(self, handle, timeout):
+        try:
+            keyutils.set_timeout(handle, timeout or 0)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED, errno.ENOKEY)
+            return False
+        return True
+
+    def add(self, name, value, timeout):
+
+        # Unfortunately, keyctl_update() loses the timeout associated
+        # with the key, and in any case races any pre-existing timeout.
+        # To avoid these complications always use add_key().
+
+        handle = keyutils.add_key(
+            self.__prefix + name, value, self._KeyRing.PROCESS)
+
+        # Processes in other sessions do not possess the user keyring,
+        # so only find keys in it that the user is permitted to search.
+
+        keyutils.set_perm(
+            handle,
+            keyutils.KEY_POS_ALL |
+            keyutils.KEY_USR_VIEW |
+            keyutils.KEY_USR_READ |
+            keyutils.KEY_USR_SETATTR |
+            (keyutils.KEY_USR_SEARCH
+             if self.__scope == self._KeyRing.USER else 0))
+        self.setTimeout(handle, timeout)
+
+        # Only add the key to the session keyring after it has
+        # been constructed with the correct timeout to avoid
+        # having the session keyring leak partially constructed
+        # keys. Link the key into the keyring of the namespace that
+        # is currently linked, creating it again if it was cleared.
+
+        self.__resolve(create=True)
+        keyutils.link(handle, self.__keyRing)
+
+        # Remove the key from the process keyring once it is published,
+        # otherwise a later add_key() by this process would update the
+        # key in place rather than constructing a replacement.
+
+        keyutils.unlink(handle, self._KeyRing.PROCESS)
+
+        return handle
+
+    def unlink(self, handle):
+        try:
+            keyutils.unlink(handle, self.__keyRing)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED)
+
+    def revoke(self, handle):
+        try:
+            keyutils.revoke(handle)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED)
+
+    def watch(self, handle, callback):
+
+        # Watch the key, or with no key, watch the keyring for keys
+        # that are linked into it. This is only possible if the kernel
+        # supports key notifications.
+
+        return _watch.KeyWatch.instance(
+            self.__keyRing).watch(handle, callback)
+
+    def clear(self):
+
+        # The session keyring holds the keys of other applications, so
+        # only the keyring of a namespace can be cleared. Unlinking the
+        # keyring from the session leaves its keys unreachable, and the
+        # kernel then destroys them.
+
+        assert self.__namespace is not None
+
+        self.__resolve()
+
+        try:
+            keyutils.clear(self.__keyRing)
+            keyutils.unlink(self.__keyRing, self.__scope)
+        except keyutils.Error as exc:
+            self._expired(exc, keyutils.EKEYREVOKED, errno.ENOENT)
+
+
+class ShmBackend:
+
+    NAME = 'shm'
+
+    # Keep each entry in a file on a tmpfs directory private to the
+    # user. The expiry time of an entry is recorded as the modification
+    # time of its file, with a zero modification time indicating an
+    # entry that does not expire. Entries are written to a temporary
+    # file and renamed into place so that readers only ever see
+    # complete entries, and changes to the directory are serialised
+    # by locking the directory.
+    #
+    # Unlike the kernel keyring, expired entries are only removed when
+    # next found, listed, or when another entry is added, and the
+    # content of the files can be swapped out.
+
+    def __init__(self, owner, directory=None, namespace=None, user=False):
+        #pylint: disable=unused-argument
+
+        # The private directory is already shared by all sessions of
+        # the user.
+
+        if directory is None:
+            directory = privateDirectory(owner)
+
+        # Keep the entries of a namespace in a subdirectory. The name
+        # of the subdirectory cannot be mistaken for an entry.
+
+        if namespace is not None:
+            directory = os.path.join(
+                directory,
+                '.ns.' + base64.urlsafe_b64encode(namespace.encode()).decode())
+            try:
+                os.mkdir(directory, 0o700)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+        self.__directory = directory
+
+    def __path(self, name):
+        return os.path.join(
+            self.__directory,
+            base64.urlsafe_b64encode(name).decode())
+
+    def __lock(self):
+        fd = os.open(self.__directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def __stat(handle):
+        try:
+            filestat = os.stat(handle[0])
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return None
+        return filestat if filestat.st_ino == handle[1] else None
+
+    def __sweep(self):
+
+        # Remove the expired entries, since the directory might outlive
+        # the session, returning the names of the remaining entries.
+        # Temporary files carry a suffix that cannot occur in an
+        # encoded name.
+
+        now = time.time()
+
+        names = []
+        for filename in os.listdir(self.__directory):
+            if '.' in filename:
+                continue
+            path = os.path.join(self.__directory, filename)
+            try:
+                filestat = os.stat(path)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+                continue
+            if filestat.st_mtime and filestat.st_mtime <= now:
+                self.revoke((path, filestat.st_ino))
+            else:
+                names.append(base64.urlsafe_b64decode(filename))
+
+        return names
+
+    def names(self):
+        return self.__sweep()
+
+    def find(self, name):
+        path = self.__path(name)
+        try:
+            filestat = os.stat(path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return None
+
+        handle = (path, filestat.st_ino)
+        if filestat.st_mtime and filestat.st_mtime <= time.time():
+            self.revoke(handle)
+            handle = EXPIRED
+
+        return handle
+
+    def read(self, handle):
+
+        # As with the kernel keyring, an expired entry cannot be read,
+        # even through a handle found before the entry expired.
+
+        try:
+            with open(handle[0], 'rb') as entry:
+                filestat = os.fstat(entry.fileno())
+                if filestat.st_ino != handle[1]:
+                    return None
+                if filestat.st_mtime and filestat.st_mtime <= time.time():
+                    return None
+                return entry.read()
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+        return None
+
+    @staticmethod
+    def quantise(secs):
+        return int(math.ceil(secs))
+
+    def lifetime(self, handle):
+        filestat = self.__stat(handle)
+        if filestat is None:
+            return 0
+        if not filestat.st_mtime:
+            return None
+        return max(int(filestat.st_mtime - time.time()), 0)
+
+    @staticmethod
+    def __expire(path, timeout):
+        now = time.time()
+        os.utime(path, (now, now + timeout if timeout else 0))
+
+    def setTimeout(self, handle, timeout):
+
+        # Do not revive an entry that has already expired.
+
+        filestat = self.__stat(handle)
+        if filestat is None or 0 < filestat.st_mtime <= time.time():
+            return False
+        try:
+            self.__expire(handle[0], timeout)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return False
+        return True
+
+    def add(self, name, value, timeout):
+        path   = self.__path(name)
+        tmpath = '{}.{}'.format(path, os.getpid())
+
+        fd = os.open(
+            tmpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, 'wb') as entry:
+                fd = None
+                entry.write(value)
+                handle = (path, os.fstat(entry.fileno()).st_ino)
+            self.__expire(tmpath, timeout)
+            lockfd = self.__lock()
+            try:
+                os.rename(tmpath, path)
+            finally:
+                os.close(lockfd)
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            try:
+                os.unlink(tmpath)
+            except OSError:
+                pass
+            raise
+
+        self.__sweep()
+
+        return handle
+
+    def unlink(self, handle):
+
+        # Only remove the file if it still holds the entry, since it
+        # might already have been replaced by a newer entry.
+
+        lockfd = self.__lock()
+        try:
+            if self.__stat(handle) is not None:
+                os.unlink(handle[0])
+        finally:
+            os.close(lockfd)
+
+    def revoke(self, handle):
+        self.unlink(handle)
+
+    @staticmethod
+    def watch(handle, callback): #pylint: disable=unused-argument
+        return False
+
+    def clear(self):
+
+        # Remove the entries, and any temporary files, but leave the
+        # counters and the subdirectories of other namespaces in place.
+
+        lockfd = self.__lock()
+        try:
+            for filename in os.listdir(self.__directory):
+                if not filename.startswith('.'):
+                    os.unlink(os.path.join(self.__directory, filename))
+        finally:
+            os.close(lockfd)
+
+
+class MemoryBackend:
+
+    NAME = 'memory'
+
+    # Keep entries in the memory of the process. This is primarily
+    # useful for testing and benchmarking Store without depending on
+    # the kernel keyring, since entries do not outlive the process.
+
+    class _Entry: #pylint: disable=too-few-public-methods
+        def __init__(self, value):
+            self.value    = value
+            self.deadline = None
+
+    def __init__(self, owner=None, namespace=None, user=False):
+        #pylint: disable=unused-argument
+        self.__entries = {}
+        self.__lock    = threading.Lock()
+
+    @staticmethod
+    def __live(handle):
+        return (handle.value is not None and
+                (handle.deadline is None or time.time() < handle.deadline))
+
+    def names(self):
+        with self.__lock:
+            return list(self.__entries)
+
+    def find(self, name):
+        with self.__lock:
+            handle = self.__entries.get(name)
+            if handle is not None and not self.__live(handle):
+                del self.__entries[name]
+                handle = None if handle.value is None else EXPIRED
+        return handle
+
+    def read(self, handle):
+        return handle.value if self.__live(handle) else None
+
+    @staticmethod
+    def quantise(secs):
+        return int(math.ceil(secs))
+
+    def lifetime(self, handle):
+        if not self.__live(handle):
+            return 0
+        if handle.deadline is None:
+            return None
+        return int(handle.deadline - time.time())
+
+    def setTimeout(self, handle, timeout):
+        if not self.__live(handle):
+            return False
+        handle.deadline = time.time() + timeout if timeout else None
+        return True
+
+    def add(self, name, value, timeout):
+        handle = self._Entry(value)
+        self.setTimeout(handle, timeout)
+        with self.__lock:
+            self.__entries[name] = handle
+        return handle
+
+    def unlink(self, handle):
+        with self.__lock:
+            for name, entry in list(self.__entries.items()):
+                if entry is handle:
+                    del self.__entries[name]
+
+    def revoke(self, handle):
+        self.unlink(handle)
+        handle.value = None
+
+    @staticmethod
+    def watch(handle, callback): #pylint: disable=unused-argument
+        return False
+
+    def clear(self):
+        with self.__lock:
+            entries = list(self.__entries.values())
+            self.__entries.clear()
+        for entry in entries:
+            entry.value = None
+
+
+BACKENDS = (KeyRingBackend, ShmBackend, MemoryBackend)
+
+def createBackend(owner, kind=None, namespace=None, user=False):
+
+    # Without an explicit choice, prefer the kernel keyring, but fall
+    # back to the tmpfs backend if keyctl(2) is not available, for
+    # example because it is blocked by a seccomp filter.
+
+    if kind is None:
+        try:
+            return KeyRingBackend(owner, namespace, user)
+        except keyutils.Error as exc:
+            if exc.args[0] not in (errno.ENOSYS, errno.EPERM, errno.EACCES):
+                raise
+            reason = os.strerror(exc.args[0])
+
+        # Mementos in /dev/shm survive the end of the session, so make
+        # the fallback visible rather than silently changing where the
+        # mementos are kept.
+
+        sys.stderr.write(
+            '{}: Keyring unavailable - {}, using {}\n'.format(
+                owner, reason, privateDirectory(owner)))
+        kind = ShmBackend.NAME
+
+    for backend in BACKENDS:
+        if backend.NAME == kind:
+            return backend(owner, namespace=namespace, user=user)
+
+    raise ValueError(kind)
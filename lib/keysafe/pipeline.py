@@ -1,63 +1,67 @@
-from __future__ import absolute_import
-
-import ctypes
-import ctypes.util
 import errno
-import select
+import fcntl
 import os
+import select
+import stat
+import struct
+import termios
+
+try:
+    from . import _linux
+except ImportError:
+    _linux = None
 
 # splice(2)
 #
-# Refactored from https://gist.github.com/NicolasT/4519146
-#
-# Provide a pure Python wrapper to splice(2).
+# Use os.splice() where the standard library provides it, otherwise
+# use the compiled binding shipped with the package.
 
-_SPLICE_F_MOVE = 1
+_SPLICE_F_MOVE     = 1
 _SPLICE_F_NONBLOCK = 2
-_SPLICE_F_MORE = 4
-_SPLICE_F_GIFT = 8
+_SPLICE_F_MORE     = 4
+
 
-_libc    = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
-_splice_ = _libc.splice
-_splice_.c_loff_t   = ctypes.c_longlong
-_splice_.c_loff_t_p = ctypes.POINTER(_splice_.c_loff_t)
-_splice_.argtypes = [
-    ctypes.c_int, _splice_.c_loff_t_p,
-    ctypes.c_int, _splice_.c_loff_t_p,
-    ctypes.c_size_t,
-    ctypes.c_uint
-]
+def _nosys(*args, **kwargs): #pylint: disable=unused-argument
+    raise _oserror(errno.ENOSYS)
+
+
+_splice_ = (
+    os.splice if hasattr(os, 'splice') else
+    _linux.splice if _linux is not None else
+    _nosys)
 
 
 def _splice(infd, inoff, outfd, outoff, size, flags):
+    return _splice_(infd, outfd, size, inoff, outoff, flags)
+
 
-    inoffref = (
-        None if inoff is None else ctypes.byref(_splice_.c_loff_t(inoff)))
+# tee(2)
+#
+# The standard library does not provide tee(2), so only the compiled
+# binding can be used.
 
-    outoffref = (
-        None if outoff is None else ctypes.byref(_splice_.c_loff_t(outoff)))
+_tee_ = _nosys if _linux is None else _linux.tee
 
-    while True:
-        rc = _splice_(infd, inoffref, outfd, outoffref, size, flags)
-        if rc != -1:
-            break
-        err = ctypes.get_errno()
-        if err != errno.EINTR:
-            raise IOError(err, os.strerror(err))
 
-    return rc
+def _tee(infd, outfd, size, flags):
+    return _tee_(infd, outfd, size, flags)
+
 
+def _oserror(err):
+    return OSError(err, os.strerror(err))
 
-def _ioerror(err):
-    return IOError(err, os.strerror(err))
 
+_F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+_F_GETPIPE_SZ = getattr(fcntl, 'F_GETPIPE_SZ', 1032)
 
-class Pipeline(object):
 
-    def __init__(self, inpfile, outfile):
+class Pipeline:
 
-        self.__inpfile = inpfile
-        self.__outfile = outfile
+    def __init__(self, inpfile, outfile, teefiles=()):
+
+        self.__inpfile  = inpfile
+        self.__outfile  = outfile
+        self.__teefiles = list(teefiles)
 
         self.__poll = select.poll()
         self.__poll.register(
@@ -67,6 +71,32 @@ class Pipeline(object):
             self.__inpfile.fileno(),
             select.POLLIN | select.POLLHUP | select.POLLERR)
 
+        for teefile in self.__teefiles:
+            self.__poll.register(
+                teefile.fileno(),
+                select.POLLHUP | select.POLLERR)
+
+        # When fanning out, tee(2) requires the source to be a pipe, so
+        # interpose an intake pipe if the input is not a pipe. Each
+        # tee output is fed through a scratch pipe that is at least as
+        # large as the source so that tee(2) never copies partially,
+        # and splice(2) can then drain the scratch pipe incrementally.
+
+        self.__intake  = None
+        self.__scratch = None
+
+        if self.__teefiles:
+            srcfd = self.__inpfile.fileno()
+            if not stat.S_ISFIFO(os.fstat(srcfd).st_mode):
+                self.__intake = os.pipe()
+                srcfd = self.__intake[0]
+
+            self.__scratch = os.pipe()
+            fcntl.fcntl(
+                self.__scratch[1],
+                _F_SETPIPE_SZ,
+                fcntl.fcntl(srcfd, _F_GETPIPE_SZ))
+
     def close(self):
 
         # It seems that sys.stdin.close() and sys.stdout.close()
@@ -77,11 +107,52 @@ class Pipeline(object):
             os.dup2(nullfile.fileno(), self.__inpfile.fileno())
             os.dup2(nullfile.fileno(), self.__outfile.fileno())
 
+        for teefile in self.__teefiles:
+            teefile.close()
+        self.__teefiles = []
+
+        for pipefds in (self.__intake, self.__scratch):
+            if pipefds is not None:
+                for fd in pipefds:
+                    os.close(fd)
+        self.__intake  = None
+        self.__scratch = None
+
     def write(self, buf):
         self.__outfile.write(buf)
+        for teefile in list(self.__teefiles):
+            try:
+                teefile.write(buf)
+            except OSError as exc:
+                if exc.errno != errno.EPIPE:
+                    raise
+                self.__removeTee(teefile.fileno())
 
     def flush(self):
         self.__outfile.flush()
+        for teefile in list(self.__teefiles):
+            try:
+                teefile.flush()
+            except OSError as exc:
+                if exc.errno != errno.EPIPE:
+                    raise
+                self.__removeTee(teefile.fileno())
+
+    def __removeTee(self, fd):
+
+        # A closed tee output is dropped, leaving the remaining
+        # outputs to continue to receive the stream.
+
+        for teefile in self.__teefiles:
+            if teefile.fileno() == fd:
+                self.__poll.unregister(fd)
+                self.__teefiles.remove(teefile)
+                try:
+                    teefile.close()
+                except OSError as exc:
+                    if exc.errno != errno.EPIPE:
+                        raise
+                break
 
     def splice(self, size):
         while True:
@@ -92,16 +163,85 @@ class Pipeline(object):
 
             for fd, _ in self.__poll.poll():
                 if self.__outfile.fileno() == fd:
-                    raise _ioerror(errno.EPIPE)
+                    raise _oserror(errno.EPIPE)
                 if self.__inpfile.fileno() == fd:
                     break
+                self.__removeTee(fd)
             else:
                 continue
 
             break
 
-        return _splice(
-            self.__inpfile.fileno(), None,
-            self.__outfile.fileno(), None,
-            size,
-            _SPLICE_F_MOVE | _SPLICE_F_NONBLOCK)
+        if self.__teefiles:
+            return self.__fanout(size)
+
+        # Input is available, so a non-blocking splice(2) can only fail
+        # with EAGAIN if the output is full. Wait for the output to
+        # drain before trying again.
+
+        while True:
+            try:
+                return _splice(
+                    self.__inpfile.fileno(), None,
+                    self.__outfile.fileno(), None,
+                    size,
+                    _SPLICE_F_MOVE | _SPLICE_F_NONBLOCK)
+            except OSError as exc:
+                if exc.errno != errno.EAGAIN:
+                    raise
+
+            outpoll = select.poll()
+            outpoll.register(self.__outfile.fileno(), select.POLLOUT)
+            for _, events in outpoll.poll():
+                if events & (select.POLLHUP | select.POLLERR):
+                    raise _oserror(errno.EPIPE)
+
+    def __fanout(self, size):
+
+        srcfd = self.__inpfile.fileno()
+
+        if self.__intake is not None:
+            size = _splice(
+                srcfd, None,
+                self.__intake[1], None,
+                size,
+                _SPLICE_F_MOVE | _SPLICE_F_NONBLOCK)
+            if not size:
+                return 0
+            srcfd = self.__intake[0]
+
+        for teefile in list(self.__teefiles):
+            size = _tee(srcfd, self.__scratch[1], size, _SPLICE_F_NONBLOCK)
+            if not size:
+                return 0
+            try:
+                self.__drain(self.__scratch[0], teefile.fileno(), size)
+            except OSError as exc:
+                if exc.errno != errno.EPIPE:
+                    raise
+                self.__removeTee(teefile.fileno())
+                with open('/dev/null', 'w') as nullfile:
+                    self.__drain(self.__scratch[0], nullfile.fileno())
+
+        return self.__drain(srcfd, self.__outfile.fileno(), size)
+
+    def __drain(self, infd, outfd, size=None):
+
+        # Block until the required amount is transferred, so that each
+        # output receives the same stream. If no amount is specified,
+        # transfer all the content that is buffered in the input pipe.
+
+        if size is None:
+            size = _pipeSize(infd)
+
+        remaining = size
+        while remaining:
+            remaining -= _splice(
+                infd, None, outfd, None, remaining, _SPLICE_F_MOVE)
+
+        return size
+
+
+def _pipeSize(fd):
+    return struct.unpack(
+        'i', fcntl.ioctl(fd, termios.FIONREAD, struct.pack('i', 0)))[0]
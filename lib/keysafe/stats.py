@@ -0,0 +1,98 @@
+import errno
+import fcntl
+import os
+import struct
+
+from . import backend as _backend
+
+# Usage counters
+#
+# Outcomes are counted in memory as they occur, and only added to the
+# counters kept in a file in the private directory of the user when
+# flushed. The file holds one native 64 bit counter per event, and is
+# locked while it is updated so that concurrent processes do not lose
+# counts.
+
+EVENTS = (
+    'hit',
+    'miss',
+    'expired',
+    'undecipherable',
+    'memorise',
+)
+
+_COUNTERS = struct.Struct('={}Q'.format(len(EVENTS)))
+
+# The leading dot ensures that the file is not mistaken for an entry
+# of the shm backend that shares the directory.
+
+_FILENAME = '.stats'
+
+
+class Stats:
+
+    def __init__(self, owner, path=None):
+        self.__owner  = owner
+        self.__path   = path
+        self.__counts = [0] * len(EVENTS)
+
+    def count(self, event):
+        self.__counts[EVENTS.index(event)] += 1
+
+    def __open(self):
+        if self.__path is None:
+            self.__path = os.path.join(
+                _backend.privateDirectory(self.__owner), _FILENAME)
+        return os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    def flush(self):
+
+        # Counting is a convenience, so do not allow a failure to
+        # update the counters to disturb the caller.
+
+        if not any(self.__counts):
+            return
+
+        try:
+            fd = self.__open()
+        except OSError:
+            return
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            counts = self.__unpack(os.pread(fd, _COUNTERS.size, 0))
+            os.pwrite(
+                fd,
+                _COUNTERS.pack(*[
+                    total + count
+                    for total, count in zip(counts, self.__counts)
+                ]),
+                0)
+        except OSError:
+            pass
+        else:
+            self.__counts = [0] * len(EVENTS)
+        finally:
+            os.close(fd)
+
+    def read(self):
+        try:
+            fd = self.__open()
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return dict.fromkeys(EVENTS, 0)
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            counts = self.__unpack(os.pread(fd, _COUNTERS.size, 0))
+        finally:
+            os.close(fd)
+
+        return dict(zip(EVENTS, counts))
+
+    @staticmethod
+    def __unpack(buf):
+        return (
+            _COUNTERS.unpack(buf) if len(buf) == _COUNTERS.size else
+            (0,) * len(EVENTS))
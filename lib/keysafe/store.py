@@ -1,25 +1,39 @@
-from __future__ import absolute_import
-
-import keyutils
 import base64
+import concurrent.futures
+import fnmatch
+import hashlib
+import os
+import threading
+import time
 
 import cryptography.fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
 
-class Store(object):
+from . import backend as _backend
+from . import watch as _watch
+
+# Names starting with a dot are reserved for entries that are not
+# mementos, such as the salt shared by the sessions of a user.
+
+RESERVED = '.'
+
+_USERSALT = '.salt'
+
+class Store:
+
+    ITERATIONS = 100000
 
-    #pylint: disable=no-member
+    # When changes to the key cannot be watched, only rely on the
+    # cached key for this long before searching again.
 
-    class _KeyRing: #pylint: disable=no-init
-        SESSION = keyutils.KEY_SPEC_SESSION_KEYRING
-        PROCESS = keyutils.KEY_SPEC_PROCESS_KEYRING
+    CACHETTL = 5
 
-    def __init__(self, owner, name, salt, keepalive=None):
+    def __init__(self, owner, name, salt, keepalive=None, backend=None,
+                 iterations=None, watch=False, stats=None):
 
-        assert isinstance(owner, basestring), type(owner)
-        assert isinstance(name, basestring), type(name)
+        assert isinstance(owner, str), type(owner)
+        assert isinstance(name, str), type(name)
+        assert salt is None or isinstance(salt, bytes), type(salt)
+        assert iterations is None or isinstance(iterations, int), iterations
 
         if not owner:
             raise ValueError(owner)
@@ -27,140 +41,339 @@ class Store(object):
         if not name:
             raise ValueError(name)
 
-        self.__crypt = cryptography.fernet.Fernet(
-            base64.urlsafe_b64encode(
-                PBKDF2HMAC(
-                    algorithm=hashes.SHA256(),
-                    length=32,
-                    salt=('' if salt is None else salt),
-                    iterations=100000,
-                    backend=default_backend()
-                ).derive(name)))
+        # Derive the key on a separate thread so that the caller can
+        # proceed with keyring lookups, prompts, etc, and only wait for
+        # the derivation when the key is first used. Use hashlib because
+        # it releases the GIL while deriving the key, and produces the
+        # same PBKDF2-HMAC-SHA256 result as the cryptography package.
+
+        self.__crypt   = None
+        self.__kdf     = (
+            name.encode(), b'' if salt is None else salt,
+            self.ITERATIONS if iterations is None else iterations)
+        self.__deriver = threading.Thread(
+            target=self.__derive, args=self.__kdf)
+        self.__deriver.daemon = True
+        self.__deriver.start()
 
         self.__keepalive = (
             12 * 60 * 60   if keepalive is None else
             keepalive * 60 if keepalive else None)
 
+        self.__deadline = None
+
         self.__owner = owner
         self.__name  = name
 
-        self.__keyName = '{}:{}'.format(self.__owner, self.__name)
+        self.__keyName = '{}:{}'.format(self.__owner, self.__name).encode()
         self.__keyId   = False
+        self.__expiry  = None
+        self.__expired = False
+        self.__watch   = watch
+        self.__stats   = stats
+
+        self.__backend = (
+            _backend.createBackend(owner) if backend is None else backend)
+
+        # Only refresh the keepalive when the remaining lifetime of the
+        # key falls below the keepalive, so that the key is retained for
+        # at least the keepalive after its last use. The backend might
+        # report the lifetime rounded down, /proc/keys for example
+        # reports 7199s as 1h, so compare against the shortest lifetime
+        # reported as at least the keepalive. Set the timeout an eighth
+        # of the keepalive beyond that, so that most uses of the key
+        # need not refresh it.
+
+        self.__retain  = (
+            self.__backend.quantise(self.__keepalive)
+            if self.__keepalive else None)
+        self.__timeout = (
+            self.__retain + self.__keepalive // 8
+            if self.__keepalive else None)
+
+    def __derive(self, name, salt, iterations):
+        try:
+            self.__crypt = cryptography.fernet.Fernet(
+                base64.urlsafe_b64encode(
+                    hashlib.pbkdf2_hmac(
+                        'sha256', name, salt, iterations, 32)))
+        except BaseException as exc: #pylint: disable=broad-except
+            self.__crypt = exc
 
-        # if the session keyring does not already exist, create one
-        # now. There is an inherent race here because multiple processes
-        # can attempt to create the session keyring, and each will
-        # end up with its own.
+    @property
+    def _crypt(self):
+        deriver = self.__deriver
+        if deriver is not None:
+            deriver.join()
+            self.__deriver = None
 
-        try:
-            keyutils.describe_key(self._KeyRing.SESSION)
-        except keyutils.Error:
-            keyutils.join_session_keyring()
-            keyutils.session_to_parent()
+        # If the derived key was discarded because the memento was
+        # revoked, derive it again.
+
+        crypt = self.__crypt
+        if crypt is None:
+            self.__derive(*self.__kdf)
+            crypt = self.__crypt
 
-        keyutils.describe_key(self._KeyRing.SESSION)
+        if isinstance(crypt, BaseException):
+            raise crypt
+        return crypt
+
+    def __notify(self, keyId, event):
+
+        # Called from the watch thread when the key changes. Discard
+        # the cached key so that the next use searches again, and if
+        # the memento has been destroyed, also discard the derived key
+        # rather than holding it in memory.
+
+        if event == _watch.SETATTR or keyId != self.__keyId:
+            return
+
+        self._keyId = False
+
+        if (keyId is not None
+                and event in (_watch.REVOKED,
+                              _watch.INVALIDATED,
+                              _watch.REMOVED)
+                and self.__deriver is None):
+            self.__crypt = None
 
     @property
     def _keyId(self):
-        if self.__keyId is False:
-            try:
-                self.__keyId = keyutils.request_key(
-                    self.__keyName, self._KeyRing.SESSION)
-            except keyutils.Error as exc:
-                if exc.args[0] not in (
-                        keyutils.EKEYEXPIRED,
-                        keyutils.EKEYREVOKED):
-                    raise
-                self.__keyId = None
-
-        return self.__keyId
+
+        # The cached key remains valid until a change is notified, or
+        # without notifications, until the cache expires. When watching
+        # is not requested, the key is cached for the lifetime of the
+        # object.
+
+        keyId = self.__keyId
+        if (keyId is not False
+                and self.__expiry is not None
+                and time.monotonic() >= self.__expiry):
+            keyId = False
+
+        if keyId is False:
+            keyId = self.__backend.find(self.__keyName)
+            if keyId is _backend.EXPIRED:
+                self.__expired = True
+                keyId = None
+            self._keyId = keyId
+
+        return keyId
 
     @_keyId.setter
     def _keyId(self, keyId):
-        self.__keyId = keyId
-
-    def _touch(self):
-        if self.__keyId:
-            try:
-                keyutils.set_timeout(self.__keyId, self.__keepalive)
-            except keyutils.Error as exc:
-                if exc.args[0] != keyutils.EKEYEXPIRED:
-                    raise
-
-    @staticmethod
-    def _unlink(keyId, keyRing):
-        try:
-            keyutils.unlink(keyId, keyRing)
-        except keyutils.Error as exc:
-            if exc.args[0] != keyutils.EKEYEXPIRED:
-                raise
+        self.__keyId  = keyId
+        self.__expiry = None
 
-    @staticmethod
-    def _read(keyId):
-        value = None
-        try:
-            value = keyutils.read_key(keyId)
-        except keyutils.Error as exc:
-            if exc.args[0] != keyutils.EKEYEXPIRED:
-                raise
-        return value
+        if self.__watch and keyId is not False:
+            if not self.__backend.watch(keyId, self.__notify):
+                self.__expiry = time.monotonic() + self.CACHETTL
 
-    @staticmethod
-    def _revoke(keyId):
-        try:
-            keyutils.revoke(keyId)
-        except keyutils.Error as exc:
-            if exc.args[0] != keyutils.keyEKEYEXPIRED:
-                raise
+    def _setDeadline(self, keyId, lifetime):
+
+        # Record when the key, having the given remaining lifetime, will
+        # next need to be refreshed. The deadline only applies to the
+        # key that was refreshed, not to any key that replaces it.
+
+        self.__deadline = (
+            None if not self.__keepalive else
+            (keyId, time.time() + lifetime - self.__retain))
+
+    def _setTimeout(self, keyId):
+        if self.__backend.setTimeout(keyId, self.__timeout):
+            self._setDeadline(keyId, self.__timeout)
+
+    def _touch(self, keyId):
+
+        # Avoid extending the keepalive on every use. Without a keepalive
+        # the key does not expire, so there is nothing to extend. The
+        # first use of the key by this Store extends the keepalive
+        # directly, since that costs less than reading the remaining
+        # lifetime. Later uses rely on the deadline recorded when the
+        # key was last refreshed, and only once that passes, consult the
+        # backend in case another process has since refreshed the key.
+
+        if not self.__keepalive:
+            return
+
+        deadline = self.__deadline
+        if deadline is not None and deadline[0] == keyId:
+            if time.time() < deadline[1]:
+                return
+
+            lifetime = self.__backend.lifetime(keyId)
+            if lifetime is None:
+                return
+            if lifetime >= self.__retain:
+                self._setDeadline(keyId, lifetime)
+                return
+
+        self._setTimeout(keyId)
 
     def forget(self):
         keyId = self._keyId
         if keyId is not None:
-            self._unlink(keyId, self._KeyRing.SESSION)
-            self._revoke(keyId)
+            self.__backend.unlink(keyId)
+            self.__backend.revoke(keyId)
+            self._keyId = None
 
     def recall(self):
-        keyId = self._keyId
+
+        # A cached key might have been replaced, revoked or expired since
+        # it was found, so if it cannot be read, search once more.
+
         value = None
-        if keyId is not None:
-            self._touch()
-            encrypted = self._read(keyId)
-            try:
-                value = self.__crypt.decrypt(encrypted)
-            except cryptography.fernet.InvalidToken:
-                value = False
+        self.__expired = False
+        for _ in range(2):
+            keyId = self._keyId
+            if keyId is None:
+                break
+
+            self._touch(keyId)
+            encrypted = self.__backend.read(keyId)
+            if encrypted is not None:
+                try:
+                    value = self._crypt.decrypt(encrypted)
+                except cryptography.fernet.InvalidToken:
+                    value = False
+                break
+
+            self._keyId = False
+
+        if self.__stats is not None:
+            self.__stats.count(
+                'undecipherable' if value is False else
+                'hit'            if value is not None else
+                'expired'        if self.__expired else
+                'miss')
 
         return value
 
-    def memorise(self, value):
+    def memorise(self, value, lifetime=None):
+
+        # The memento expires after the keepalive, unless a lifetime in
+        # seconds is given, with a lifetime of 0 meaning no expiry.
 
+        assert isinstance(value, bytes), type(value)
         assert len(value) < 16*1024, len(value)
 
         prevKeyId = self._keyId
 
-        # Unfortunately, keyctl_update() loses the timeout associated
-        # with the key, and in any case races any pre-existing timeout.
-        # To avoid these complications always use add_key().
+        # The backend constructs the new key with the correct timeout
+        # before making it visible, so revoke the previous key only
+        # once the replacement is in place.
 
-        encrypted = self.__crypt.encrypt(value)
-        keyId = keyutils.add_key(
-            self.__keyName, encrypted, self._KeyRing.PROCESS)
+        encrypted = self._crypt.encrypt(value)
+        keyId = self.__backend.add(
+            self.__keyName,
+            encrypted,
+            self.__timeout if lifetime is None else lifetime or None)
         self._keyId = keyId
-
-        keyutils.set_perm(
-            keyId,
-            keyutils.KEY_POS_ALL |
-            keyutils.KEY_USR_VIEW |
-            keyutils.KEY_USR_READ |
-            keyutils.KEY_USR_SETATTR)
-        self._touch()
-
-        # Only add the key to the session keyring after it has
-        # been constructed with the correct timeout to avoid
-        # having the session keyring leak partially constructed
-        # keys.
-
-        keyutils.link(keyId, self._KeyRing.SESSION)
+        if lifetime is None:
+            self._setDeadline(keyId, self.__timeout)
+        else:
+            self.__deadline = None
 
         if prevKeyId is not None:
-            self._revoke(prevKeyId)
+            self.__backend.revoke(prevKeyId)
+
+        if self.__stats is not None:
+            self.__stats.count('memorise')
+
+
+def userSalt(owner, backend):
+
+    # Return the salt shared by all sessions of the user, creating it if
+    # necessary. The salt does not expire, so that mementos remain
+    # decipherable for as long as they are kept. Adding the salt
+    # replaces any salt already present, which would leave mementos
+    # encrypted by concurrent processes undecipherable, so serialise
+    # creation by locking the private directory of the user, so that
+    # only the first process creates the salt and the others find it.
+
+    name = '{}:{}'.format(owner, _USERSALT).encode()
+
+    with _backend.privateLock(owner):
+        for create in (False, True):
+            if create:
+                backend.add(name, base64.b16encode(os.urandom(16)), None)
+
+            handle = backend.find(name)
+            if handle is not None and handle is not _backend.EXPIRED:
+                salt = backend.read(handle)
+                if salt:
+                    return salt
+
+    raise RuntimeError('Unable to create user salt')
+
+
+def rotate(owner, pattern, salt, newSalt, keepalive=None, backend=None,
+           iterations=None, newIterations=None, jobs=None):
+
+    # Re-encrypt each memento matching the pattern under the new salt
+    # and iteration count, and return a list of the names and results.
+    # Unless a keepalive is given, each memento keeps the remaining
+    # lifetime of the memento it replaces, rounded down to the nearest
+    # lifetime that the backend reports.
+    # Each memento is replaced using memorise(), so at all times each
+    # key holds either the old or the new ciphertext. The result is
+    # True if the memento was rotated, None if it expired before it
+    # could be read, and False if it cannot be deciphered using the
+    # old parameters, in which case it is left untouched.
+    #
+    # Most of the time is spent deriving keys, and since hashlib
+    # releases the GIL while deriving, threads are sufficient to
+    # occupy all the processors without exposing mementos to
+    # worker processes.
+
+    if backend is None:
+        backend = _backend.createBackend(owner)
+
+    prefix = '{}:'.format(owner).encode()
+
+    names = sorted(set(
+        name[len(prefix):].decode()
+        for name in backend.names()
+        if name.startswith(prefix)))
+
+    names = [
+        name for name in names
+        if not name.startswith(RESERVED) and fnmatch.fnmatchcase(name, pattern)
+    ]
+
+    def _rotate(name):
+
+        # Read the old memento without extending its keepalive, since
+        # it is about to be replaced.
+
+        oldStore = Store(owner, name, salt,
+                         keepalive=0,
+                         backend=backend,
+                         iterations=iterations)
+        newStore = Store(owner, name, newSalt,
+                         keepalive=keepalive,
+                         backend=backend,
+                         iterations=newIterations)
+
+        lifetime = None
+        if keepalive is None:
+            handle = backend.find(prefix + name.encode())
+            if handle is None or handle is _backend.EXPIRED:
+                return None
+            lifetime = backend.lifetime(handle)
+            if lifetime == 0:
+                return None
+            if lifetime is None:
+                lifetime = 0
+
+        value = oldStore.recall()
+        if value is None or value is False:
+            return value
+
+        newStore.memorise(value, lifetime=lifetime)
+        return True
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=jobs or os.cpu_count() or 1) as executor:
+        return list(zip(names, executor.map(_rotate, names)))
@@ -0,0 +1,247 @@
+import errno
+import fcntl
+import os
+import struct
+import threading
+import weakref
+
+try:
+    from . import _linux
+except ImportError:
+    _linux = None
+
+# Kernel key notifications
+#
+# A notification pipe is created using pipe2(2) with O_NOTIFICATION_PIPE,
+# and keys are watched using keyctl(KEYCTL_WATCH_KEY). The kernel then
+# posts a record to the pipe whenever a watched key, or a key linked
+# into a watched keyring, changes. See include/uapi/linux/watch_queue.h
+# and include/uapi/linux/keyctl.h.
+
+_O_NOTIFICATION_PIPE      = os.O_EXCL
+_IOC_WATCH_QUEUE_SET_SIZE = (ord('W') << 8) | 0x60
+
+_WATCH_QUEUE_SIZE = 256
+
+_WATCH_TYPE_META       = 0
+_WATCH_TYPE_KEY_NOTIFY = 1
+
+_WATCH_META_REMOVAL_NOTIFICATION = 0
+_WATCH_META_LOSS_NOTIFICATION    = 1
+
+_WATCH_INFO_LENGTH   = 0x0000007f
+_WATCH_INFO_ID       = 0x0000ff00
+_WATCH_INFO_ID_SHIFT = 8
+
+_KEYRING_WATCH_ID = 1
+_KEY_WATCH_ID     = 2
+
+# Events delivered to callbacks. Events with non-negative values are
+# the key notification subtypes posted by the kernel.
+
+INSTANTIATED = 0
+UPDATED      = 1
+LINKED       = 2
+UNLINKED     = 3
+CLEARED      = 4
+REVOKED      = 5
+INVALIDATED  = 6
+SETATTR      = 7
+
+REMOVED = -1
+LOST    = -2
+
+
+def parseNotifications(buf):
+
+    # Each record starts with a struct watch_notification comprising
+    # the type and subtype, followed by the length of the record and
+    # the id of the watch. Key notifications carry the serial number
+    # of the key, and an auxiliary key, while removal notifications
+    # carry the serial number of the key that is no longer watched.
+
+    offset = 0
+    while offset + 8 <= len(buf):
+        typeword, info = struct.unpack_from('=II', buf, offset)
+
+        length = info & _WATCH_INFO_LENGTH
+        if length < 8 or offset + length > len(buf):
+            break
+
+        notifyType = typeword & 0xffffff
+        subtype    = typeword >> 24
+        watchId    = (info & _WATCH_INFO_ID) >> _WATCH_INFO_ID_SHIFT
+
+        if notifyType == _WATCH_TYPE_KEY_NOTIFY and length >= 16:
+            keyId, aux = struct.unpack_from('=ii', buf, offset + 8)
+            yield watchId, subtype, keyId, aux
+
+        elif notifyType == _WATCH_TYPE_META:
+            if subtype == _WATCH_META_LOSS_NOTIFICATION:
+                yield watchId, LOST, None, None
+            elif (subtype == _WATCH_META_REMOVAL_NOTIFICATION
+                  and length >= 16):
+                keyId, = struct.unpack_from('=Q', buf, offset + 8)
+                yield watchId, REMOVED, keyId, None
+
+        offset += length
+
+
+class KeyWatch:
+
+    # Watch a keyring, and keys linked into it, on behalf of any number
+    # of callbacks. A single thread reads the notification pipe, and
+    # calls callback(keyId, event) for each callback registered for the
+    # key. Callbacks registered without a key are called when keys are
+    # linked into, or cleared from, the keyring. When notifications are
+    # lost, every callback is called with LOST.
+    #
+    # Callbacks are held by weak reference so that watching does not
+    # extend the lifetime of the objects being notified.
+
+    __instances = {}
+    __instancesLock = threading.Lock()
+
+    @classmethod
+    def instance(cls, keyRing):
+        with cls.__instancesLock:
+            keyWatch = cls.__instances.get(keyRing)
+            if keyWatch is None:
+                keyWatch = cls(keyRing)
+                cls.__instances[keyRing] = keyWatch
+        return keyWatch
+
+    def __init__(self, keyRing):
+
+        self.__lock      = threading.Lock()
+        self.__callbacks = {}
+        self.__fds       = None
+        self.__available = False
+
+        # Without a kernel configured with CONFIG_WATCH_QUEUE, pipe2(2)
+        # fails with ENOPKG, and the watch is unavailable.
+
+        if _linux is None:
+            return
+
+        try:
+            fds = os.pipe2(_O_NOTIFICATION_PIPE | os.O_CLOEXEC)
+        except OSError:
+            return
+
+        try:
+            fcntl.ioctl(fds[0], _IOC_WATCH_QUEUE_SET_SIZE, _WATCH_QUEUE_SIZE)
+            _linux.keyctl_watch_key(keyRing, fds[0], _KEYRING_WATCH_ID)
+        except OSError:
+            for fd in fds:
+                os.close(fd)
+            return
+
+        self.__fds       = fds
+        self.__available = True
+
+        reader = threading.Thread(target=self.__read)
+        reader.daemon = True
+        reader.start()
+
+    @property
+    def available(self):
+        return self.__available
+
+    def watch(self, keyId, callback):
+
+        # Return True if the callback will be notified of changes to
+        # the key, or False if changes cannot be watched.
+
+        if not self.available:
+            return False
+
+        with self.__lock:
+            callbacks = self.__callbacks.get(keyId)
+            if callbacks is None:
+                if keyId is not None:
+                    try:
+                        _linux.keyctl_watch_key(
+                            keyId, self.__fds[0], _KEY_WATCH_ID)
+                    except OSError as exc:
+                        if exc.errno != errno.EBUSY:
+                            return False
+                callbacks = []
+                self.__callbacks[keyId] = callbacks
+
+            callbacks[:] = [ref for ref in callbacks if ref() is not None]
+
+            ref = weakref.WeakMethod(callback)
+            if ref not in callbacks:
+                callbacks.append(ref)
+
+        return True
+
+    def __read(self):
+
+        # The write side of the pipe is held open, so reads only
+        # complete when notifications are posted.
+
+        while self.available:
+            try:
+                buf = os.read(self.__fds[0], 4096)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                self.__available = False
+                self.__notify(None, LOST)
+                break
+
+            for watchId, event, keyId, aux in parseNotifications(buf):
+                if watchId == _KEYRING_WATCH_ID:
+                    self.__notifyKeyRing(event, keyId, aux)
+                else:
+                    self.__notifyKey(event, keyId)
+
+    def __notifyKeyRing(self, event, keyId, aux): #pylint: disable=unused-argument
+
+        # A key linked into the keyring might replace a key of the same
+        # name, so all callbacks are notified. If the keyring itself
+        # is removed, the watch can no longer be relied upon.
+
+        if event == UNLINKED:
+            self.__notify(aux, event)
+        elif event in (LINKED, CLEARED, LOST):
+            self.__notify(None, event)
+        elif event in (REVOKED, INVALIDATED, REMOVED):
+            if event == REMOVED:
+                self.__available = False
+            self.__notify(None, LOST)
+
+    def __notifyKey(self, event, keyId):
+        if event == LOST:
+            self.__notify(None, event)
+        else:
+            self.__notify(keyId, event)
+            if event == REMOVED:
+                with self.__lock:
+                    self.__callbacks.pop(keyId, None)
+
+    def __notify(self, keyId, event):
+
+        # Notify the callbacks registered for the key, or all callbacks
+        # if no key is specified. Call the callbacks without holding the
+        # lock so that they can register watches.
+
+        with self.__lock:
+            if keyId is None:
+                targets = [
+                    (watchedId, ref)
+                    for watchedId, callbacks in self.__callbacks.items()
+                    for ref in callbacks
+                ]
+            else:
+                targets = [
+                    (keyId, ref)
+                    for ref in self.__callbacks.get(keyId, ())
+                ]
+
+        for watchedId, ref in targets:
+            callback = ref()
+            if callback is not None:
+                callback(watchedId, event)
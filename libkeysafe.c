@@ -17,6 +17,7 @@
 
 static const char argIndex_[]   = "_" MODULE_NAME_ "_ARGINDEX";
 static const char argFile_[]    = "_" MODULE_NAME_ "_ARGFILE";
+static const char argEnv_[]     = "_" MODULE_NAME_ "_ARGENV";
 static const char argPreload_[] = "_" MODULE_NAME_ "_PRELOAD";
 
 static void
@@ -129,6 +130,34 @@ replaceArg_(char **aArg, const char *aArgFile)
     return rc;
 }
 
+static int
+replaceEnv_(const char *aEnvName, const char *aArgFile)
+{
+    int rc = -1;
+
+    char *arg = readLine_(aArgFile);
+    if ( ! arg)
+        goto out;
+
+    /* The environment takes a copy of the value, so scrub the
+     * line buffer to avoid leaving another copy on the heap. */
+
+    if (setenv(aEnvName, arg, 1))
+        goto out;
+
+    rc = 0;
+
+  out:
+
+    if (arg)
+    {
+        memset(arg, 0, strlen(arg));
+        free(arg);
+    }
+
+    return rc;
+}
+
 static char *
 strcmpenv_(const char *aEnvName, char *aEnv)
 {
@@ -229,6 +258,7 @@ main_(int argc, char **argv, char **env)
 {
     char *argindex   = 0;
     char *argfile    = 0;
+    char *argenv     = 0;
     char *argpreload = 0;
 
     /* Find the parameters that match the data provided by the application.
@@ -245,6 +275,9 @@ main_(int argc, char **argv, char **env)
         env = strcmpenv_(argFile_, *envp);
         if (env) { argfile = env; continue; }
 
+        env = strcmpenv_(argEnv_, *envp);
+        if (env) { argenv = env; continue; }
+
         env = strcmpenv_(argPreload_, *envp);
         if (env) { argpreload = env; continue; }
     }
@@ -272,6 +305,14 @@ main_(int argc, char **argv, char **env)
         if (replaceArg_(argp, argfile))
             die("Unable to replace argument - %s", argfile);
     }
+    else if (argenv && argfile)
+    {
+        if ( ! *argenv || strchr(argenv, '='))
+            die("Unable to parse environment variable - %s", argenv);
+
+        if (replaceEnv_(argenv, argfile))
+            die("Unable to set environment variable - %s", argenv);
+    }
 
     if (rewritePreload_(argpreload))
         die("Unable to rewrite LD_PRELOAD");
@@ -288,6 +329,12 @@ main_(int argc, char **argv, char **env)
         unsetenv(argFile_);
     }
 
+    if (argenv)
+    {
+        *argenv = 0;
+        unsetenv(argEnv_);
+    }
+
     if (argpreload)
     {
         *argpreload = 0;
@@ -6,4 +6,4 @@
 
 export PYTHONPATH="${0%/*}/lib:${0%/*}/pkg${PYTHONPATH+:$PYTHONPATH}"
 
-exec python "$@"
+exec python3 "$@"
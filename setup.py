@@ -15,7 +15,7 @@ def gitversion():
     with open(os.devnull, 'r') as devnull:
         version = next(iter(subprocess.check_output(
             ['git', 'tag', '-l', '--points-at', 'HEAD'],
-            stdin=devnull).split('\n', 1)), '').strip()
+            stdin=devnull).decode().split('\n', 1)), '').strip()
 
         if version:
             match = re.search(r'\d+\.\d+(\.\d+(\.\d+)?)?', version)
@@ -23,7 +23,8 @@ def gitversion():
 
         if not version:
             version = subprocess.check_output(
-                ['git', 'rev-parse', 'HEAD'], stdin=devnull).strip()[0:7]
+                ['git', 'rev-parse', 'HEAD'],
+                stdin=devnull).decode().strip()[0:7]
 
     return version
 
@@ -42,7 +43,7 @@ def version(filename):
     while True:
         try:
             versionfile = open(filename, 'r')
-        except IOError as exc:
+        except OSError as exc:
             if label is None or exc.errno != errno.ENOENT:
                 raise
         else:
@@ -81,7 +82,7 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Environment :: Console',
         'Operating System :: POSIX :: Linux',
-        'Programming Language :: Python :: 2.7',
+        'Programming Language :: Python :: 3',
         'Topic :: Security',
         'Topic :: System :: Systems Administration',
         'Topic :: System :: Shells',
@@ -91,14 +92,21 @@ setup(
           '{pkgname} = {pkgname}.__main__:main'.format(pkgname=PKGNAME),
         ]},
     package_dir={'' : 'lib'},
+    python_requires='>=3.6',
     install_requires=['keyutils', 'cryptography'],
     include_package_data=True,
     ext_package=PKGNAME,
-    ext_modules=[Extension(
-        'lib{}'.format(PKGNAME),
-        ['libkeysafe.c'],
-        define_macros=[
-            ('_GNU_SOURCE', None),
-            ('MODULE_NAME', PKGNAME.upper()),
-            ('MODULE_name', PKGNAME)],
-        extra_compile_args=['-std=c99'])])
+    ext_modules=[
+        Extension(
+            'lib{}'.format(PKGNAME),
+            ['libkeysafe.c'],
+            define_macros=[
+                ('_GNU_SOURCE', None),
+                ('MODULE_NAME', PKGNAME.upper()),
+                ('MODULE_name', PKGNAME)],
+            extra_compile_args=['-std=c99']),
+        Extension(
+            '_linux',
+            ['_linux.c'],
+            define_macros=[('_GNU_SOURCE', None)],
+            extra_compile_args=['-std=c99'])])
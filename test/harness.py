@@ -0,0 +1,63 @@
+import os
+
+import keyutils
+
+# Helpers shared by the checks that race processes against each other
+# in a fresh login session.
+
+OWNER = 'keysafe-test'
+
+
+def leaveSession():
+
+    # Start a new session, and replace the inherited session keyring
+    # with the user session keyring, as seen by a fresh login.
+
+    os.setsid()
+    keyutils.join_session_keyring(
+        '_uid_ses.{}'.format(os.getuid()).encode())
+
+
+def inSession(check, *args):
+
+    # Run the check in a new session, returning True if it succeeds.
+
+    pid = os.fork()
+    if not pid:
+        leaveSession()
+        try:
+            ok = check(*args)
+        except BaseException as exc: #pylint: disable=broad-except
+            print('{}: {}'.format(check.__name__, exc))
+            ok = False
+        os._exit(0 if ok else 1)
+
+    return os.waitpid(pid, 0)[1] == 0
+
+
+def race(workers, work):
+
+    # Run work(worker) in each of the workers concurrently, returning
+    # the number of workers that failed. The workers block on the pipe
+    # until all of them have been created, so that they start together.
+
+    rdfd, wrfd = os.pipe()
+
+    pids = []
+    for worker in range(workers):
+        pid = os.fork()
+        if not pid:
+            os.close(wrfd)
+            os.read(rdfd, 1)
+            try:
+                work(worker)
+            except BaseException as exc: #pylint: disable=broad-except
+                print('worker {}: {}'.format(worker, exc))
+                os._exit(1)
+            os._exit(0)
+        pids.append(pid)
+
+    os.close(rdfd)
+    os.close(wrfd)
+
+    return sum(1 for pid in pids if os.waitpid(pid, 0)[1])
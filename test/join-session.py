@@ -0,0 +1,138 @@
+import os
+import struct
+import sys
+import time
+
+import keyutils
+
+from keysafe import backend
+
+from harness import OWNER, inSession, race
+
+# Run many first uses of the keyring backend concurrently in a fresh
+# session without a session keyring, and verify that they converge on
+# a single session keyring. Each worker links a probe key into the
+# keyring it joined, and the keyring installed in the session leader
+# must hold every probe. Then verify that a keyring of the expected
+# name is not joined if it is accessible to others.
+
+SESSION = keyutils.KEY_SPEC_SESSION_KEYRING
+USER    = keyutils.KEY_SPEC_USER_KEYRING
+
+
+def sessionName():
+    return keyutils.describe_key(SESSION).split(b';', 4)[-1].decode()
+
+
+def probes():
+    keyring = keyutils.read_key(SESSION)
+    names = []
+    for keyId in struct.unpack('={}i'.format(len(keyring) // 4), keyring):
+        name = keyutils.describe_key(keyId).split(b';', 4)[-1]
+        if name.startswith(b'probe:'):
+            names.append(name)
+    return names
+
+
+def addProbe(worker):
+    backend.KeyRingBackend(OWNER)
+    keyutils.add_key('probe:{}'.format(worker).encode(), b'.', SESSION)
+
+
+def converge(expected, workers):
+
+    # The workers race to join the session keyring.
+
+    failed = race(workers, addProbe)
+
+    found  = len(probes())
+    joined = sessionName()
+    print('{} workers joined {}, {} of {} probes found'.format(
+        workers, joined, found, workers))
+
+    return not failed and found == workers and joined == expected
+
+
+def refuseShared(expected):
+
+    # Create the keyring that the backend expects to join, but grant
+    # others permission to search and link it. Hold a reference to the
+    # keyring in the user keyring so that it survives rejoining the
+    # user session keyring.
+
+    keyRing = keyutils.join_session_keyring(expected.encode())
+    keyutils.set_perm(
+        keyRing,
+        keyutils.KEY_POS_ALL | keyutils.KEY_USR_ALL | keyutils.KEY_OTH_ALL)
+    keyutils.link(keyRing, USER)
+    keyutils.join_session_keyring(
+        '_uid_ses.{}'.format(os.getuid()).encode())
+
+    try:
+        backend.KeyRingBackend(OWNER)
+        joined = sessionName()
+    finally:
+        keyutils.unlink(keyRing, USER)
+
+    print('Shared keyring {}, joined {}'.format(expected, joined))
+
+    return joined != expected
+
+
+def refuseForeign(expected):
+
+    # As the superuser, have another user create the keyring that the
+    # backend expects to join, granting others permission to join it.
+
+    rdfd, wrfd = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(rdfd)
+        os.setgid(65534)
+        os.setuid(65534)
+        keyRing = keyutils.join_session_keyring(expected.encode())
+        keyutils.set_perm(keyRing, keyutils.KEY_POS_ALL |
+                          keyutils.KEY_USR_ALL | keyutils.KEY_OTH_ALL)
+        os.write(wrfd, b'.')
+        time.sleep(60)
+        os._exit(0)
+
+    os.close(wrfd)
+    os.read(rdfd, 1)
+    os.close(rdfd)
+
+    try:
+        backend.KeyRingBackend(OWNER)
+        joined = sessionName()
+    finally:
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+
+    print('Foreign keyring {}, joined {}'.format(expected, joined))
+
+    return joined != expected
+
+
+def expectSession(check, *args):
+
+    # Run the check with the name of the session keyring that the
+    # backend is expected to join in this session.
+
+    #pylint: disable=protected-access
+    return check(backend.KeyRingBackend._sessionName(OWNER), *args)
+
+
+def main():
+
+    workers = 16 if len(sys.argv) < 2 else int(sys.argv[1])
+
+    ok = inSession(expectSession, converge, workers)
+    ok = inSession(expectSession, refuseShared) and ok
+    if os.getuid() == 0:
+        ok = inSession(expectSession, refuseForeign) and ok
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import sys
+import time
+
+import keyutils
+
+from keysafe import backend
+
+from harness import OWNER, inSession, race
+
+# Create the keyring of a namespace from many processes concurrently in
+# a fresh session, and verify that they converge on a single keyring.
+# Each worker adds a probe key to the namespace, and the namespace
+# keyring that remains linked must hold every probe. The window
+# between finding no keyring and creating one is widened so that the
+# race is exposed even on a single processor.
+
+NAMESPACE = 'race'
+
+
+def slowAddKey(addKey):
+
+    def _addKey(name, value, keyring, keyType=b'user'):
+        if keyType == b'keyring':
+            time.sleep(0.1)
+        return addKey(name, value, keyring, keyType=keyType)
+
+    return _addKey
+
+
+def addProbe(worker):
+    keyutils.add_key = slowAddKey(keyutils.add_key)
+    backend.KeyRingBackend(OWNER, NAMESPACE).add(
+        'probe:{}'.format(worker).encode(), b'.', None)
+
+
+def converge(workers):
+
+    # Join the session keyring before the race so that the workers race
+    # only to create the namespace keyring.
+
+    backend.KeyRingBackend(OWNER, parent=False)
+
+    failed = race(workers, addProbe)
+
+    found = len([
+        name
+        for name in backend.KeyRingBackend(OWNER, NAMESPACE).names()
+        if name.startswith(b'probe:')])
+    print('{} workers created namespace {}, {} of {} probes found'.format(
+        workers, NAMESPACE, found, workers))
+
+    return not failed and found == workers
+
+
+def main():
+
+    workers = 16 if len(sys.argv) < 2 else int(sys.argv[1])
+
+    return 0 if inSession(converge, workers) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import re
+import struct
+import sys
+
+from keysafe import watch
+
+# Build notification records as laid out by the kernel, taking the
+# field layout and values from the uapi header rather than from the
+# parser, and verify that each record is decoded as expected.
+
+HEADER = '/usr/include/linux/watch_queue.h'
+
+
+def readHeader(filename):
+
+    with open(filename, 'r') as headerfile:
+        text = headerfile.read()
+
+    constants = {}
+    for name, value in re.findall(
+            r'^#define\s+(WATCH_\w+)\s+(0x[0-9a-fA-F]+|\d+)', text, re.M):
+        constants[name] = int(value, 0)
+    for name, value in re.findall(
+            r'^\s+((?:WATCH|NOTIFY)_\w+)\s*=\s*(\d+)', text, re.M):
+        constants[name] = int(value, 0)
+
+    return constants
+
+
+def record(uapi, notifyType, subtype, watchId, payload):
+
+    # struct watch_notification packs the type into the low 24 bits
+    # and the subtype into the high 8 bits of the first word, and the
+    # length and watch id into the info word.
+
+    length = 8 + len(payload)
+    info = (
+        (length << uapi['WATCH_INFO_LENGTH__SHIFT'])
+        & uapi['WATCH_INFO_LENGTH']
+        | (watchId << uapi['WATCH_INFO_ID__SHIFT'])
+        & uapi['WATCH_INFO_ID'])
+
+    return struct.pack('=II', notifyType | subtype << 24, info) + payload
+
+
+def main():
+
+    uapi = readHeader(HEADER if len(sys.argv) < 2 else sys.argv[1])
+
+    keyNotify = uapi['WATCH_TYPE_KEY_NOTIFY']
+    meta      = uapi['WATCH_TYPE_META']
+
+    cases = [
+        (record(uapi, keyNotify, uapi['NOTIFY_KEY_LINKED'],
+                1, struct.pack('=II', 0x1234, 0x5678)),
+         (1, watch.LINKED, 0x1234, 0x5678)),
+        (record(uapi, keyNotify, uapi['NOTIFY_KEY_UNLINKED'],
+                1, struct.pack('=II', 0x1234, 0x5678)),
+         (1, watch.UNLINKED, 0x1234, 0x5678)),
+        (record(uapi, keyNotify, uapi['NOTIFY_KEY_CLEARED'],
+                1, struct.pack('=II', 0x1234, 0)),
+         (1, watch.CLEARED, 0x1234, 0)),
+        (record(uapi, keyNotify, uapi['NOTIFY_KEY_REVOKED'],
+                2, struct.pack('=II', 0x4321, 0)),
+         (2, watch.REVOKED, 0x4321, 0)),
+        (record(uapi, meta, uapi['WATCH_META_REMOVAL_NOTIFICATION'],
+                2, struct.pack('=Q', 0x4321)),
+         (2, watch.REMOVED, 0x4321, None)),
+        (record(uapi, meta, uapi['WATCH_META_LOSS_NOTIFICATION'],
+                0, b''),
+         (0, watch.LOST, None, None)),
+    ]
+
+    failures = 0
+
+    buf = b''
+    for recordbuf, expected in cases:
+        buf += recordbuf
+        decoded = list(watch.parseNotifications(recordbuf))
+        if decoded != [expected]:
+            print('FAIL {} decoded as {}'.format(expected, decoded))
+            failures += 1
+
+    decoded = list(watch.parseNotifications(buf))
+    if decoded != [expected for _, expected in cases]:
+        print('FAIL concatenated records decoded as {}'.format(decoded))
+        failures += 1
+
+    print('{} of {} checks passed'.format(
+        len(cases) + 1 - failures, len(cases) + 1))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
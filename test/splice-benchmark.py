@@ -0,0 +1,86 @@
+import ctypes
+import ctypes.util
+import fcntl
+import os
+import sys
+import timeit
+
+from keysafe import _linux
+
+# Compare the cost of each call moving a chunk between two pipes using
+# splice(2) through ctypes, through os.splice() where the standard
+# library provides it, and through the compiled binding. The chunk is
+# moved back and forth between the pipes, so each call moves the whole
+# chunk without the pipes filling or draining.
+
+CHUNKS = (4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20)
+
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+
+
+def ctypesSplice():
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    splice_ = libc.splice
+    splice_.restype  = ctypes.c_ssize_t
+    splice_.argtypes = (
+        ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_size_t, ctypes.c_uint)
+
+    def _splice(src, dst, count):
+        rc = splice_(src, None, dst, None, count, 0)
+        if rc == -1:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return rc
+
+    return _splice
+
+
+def measure(splice, chunk, number):
+
+    pipes = [os.pipe(), os.pipe()]
+    try:
+        for _, wrfd in pipes:
+            fcntl.fcntl(wrfd, F_SETPIPE_SZ, chunk)
+
+        os.write(pipes[0][1], b'.' * chunk)
+
+        def _bounce():
+            splice(pipes[0][0], pipes[1][1], chunk)
+            splice(pipes[1][0], pipes[0][1], chunk)
+
+        best = min(timeit.repeat(_bounce, number=number, repeat=5))
+    finally:
+        for rdfd, wrfd in pipes:
+            os.close(rdfd)
+            os.close(wrfd)
+
+    return best / (2 * number)
+
+
+def main():
+
+    number = 10000 if len(sys.argv) < 2 else int(sys.argv[1])
+
+    splices = [('ctypes', ctypesSplice())]
+    if hasattr(os, 'splice'):
+        splices.append(('os.splice', os.splice))
+    splices.append(('_linux.splice', _linux.splice))
+
+    print('{:8} {}'.format(
+        'chunk', ' '.join('{:>14}'.format(name) for name, _ in splices)))
+
+    for chunk in CHUNKS:
+        print('{:8} {}'.format(
+            '{} KiB'.format(chunk >> 10),
+            ' '.join(
+                '{:>12.2f}us'.format(measure(splice, chunk, number) * 1e6)
+                for _, splice in splices)))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+
+from keysafe import backend
+from keysafe import store
+
+from harness import OWNER, inSession, race
+
+# Have many processes concurrently make first use of the salt shared by
+# the sessions of the user, and verify that they all use the same salt,
+# and that the salt remains in place. The window between finding no
+# salt and creating one is widened so that the race is exposed even on
+# a single processor.
+
+#pylint: disable=protected-access
+SALT = '{}:{}'.format(OWNER, store._USERSALT).encode()
+#pylint: enable=protected-access
+
+
+def slowAdd(add):
+
+    def _add(self, name, value, timeout):
+        if name == SALT:
+            time.sleep(0.1)
+        return add(self, name, value, timeout)
+
+    return _add
+
+
+def removeSalt(userBackend):
+    handle = userBackend.find(SALT)
+    if handle is not None and handle is not backend.EXPIRED:
+        userBackend.unlink(handle)
+        userBackend.revoke(handle)
+
+
+def converge(kind, workers):
+
+    userBackend = backend.createBackend(OWNER, kind, user=True)
+    removeSalt(userBackend)
+
+    rdfd, wrfd = os.pipe()
+
+    def _useSalt(worker): #pylint: disable=unused-argument
+        os.close(rdfd)
+        cls = type(userBackend)
+        cls.add = slowAdd(cls.add)
+        os.write(wrfd, store.userSalt(
+            OWNER, backend.createBackend(OWNER, kind, user=True)) + b'\n')
+
+    try:
+        failed = race(workers, _useSalt)
+        os.close(wrfd)
+        with os.fdopen(rdfd, 'rb') as rdfile:
+            salts = set(rdfile.read().split())
+        salts.add(store.userSalt(OWNER, userBackend))
+    finally:
+        removeSalt(userBackend)
+
+    print('{} workers using the {} backend used {} user salt{}'.format(
+        workers, kind, len(salts), '' if len(salts) == 1 else 's'))
+
+    return not failed and len(salts) == 1
+
+
+def main():
+
+    workers = 8 if len(sys.argv) < 2 else int(sys.argv[1])
+
+    ok = True
+    for kind in (backend.KeyRingBackend.NAME, backend.ShmBackend.NAME):
+        ok = inSession(converge, kind, workers) and ok
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())